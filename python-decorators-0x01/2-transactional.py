@@ -1,25 +1,46 @@
 import sqlite3 
 import functools
 
+from cache_store import query_cache, tables_written
+
 def transactional(func):
     """
     A decorator that manages a database transaction.
     It commits changes on success and rolls back on failure.
+
+    After a successful commit, the cached query results (see cache_store.py)
+    read from the tables the transaction wrote to are evicted, so later
+    cached reads see the write. The written tables are found by tracing
+    the statements run on the connection, which replaces any trace
+    callback set on it for the duration of the call. On connections that
+    cannot be traced the whole cache is cleared instead.
     """
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        written = set()
+        traced = hasattr(conn, 'set_trace_callback')
+        if traced:
+            conn.set_trace_callback(lambda statement: written.update(tables_written(statement)))
         try:
             # Call the decorated function with the connection
             result = func(conn, *args, **kwargs)
             # Commit the transaction if no errors occurred
             conn.commit()
             print("Transaction committed successfully.")
-            return result
         except Exception as e:
             # Rollback the transaction on any error
             conn.rollback()
             print(f"Transaction rolled back due to error: {e}")
             raise  # Re-raise the exception to propagate the error
+        finally:
+            if traced:
+                conn.set_trace_callback(None)
+        # Evict the cached reads made stale by the committed writes
+        if traced:
+            query_cache.invalidate_tables(written)
+        else:
+            query_cache.clear()
+        return result
     return wrapper
 
 def with_db_connection(func):
@@ -1,9 +1,10 @@
 import time
 import sqlite3
 import functools
+import inspect
 
-# A global dictionary to store cached query results
-query_cache = {}
+from cache_store import MISSING, make_key, query_cache, tables_read
+from single_flight import query_flights
 
 def with_db_connection(func):
     """
@@ -28,36 +29,120 @@ def with_db_connection(func):
                 conn.close()
     return wrapper
 
-def cache_query(func):
+def cache_key(signature, conn, args, kwargs):
+    """
+    Returns the (query, cache key) of a call to a cached query function.
+    The call is bound to the function's signature and the query and bind
+    parameters are read from its 'query' and 'params' arguments, however
+    they were passed. query is None if the call has no query, and the key
+    is None if the parameters cannot be hashed (the call is not cached).
+
+    Raises:
+        TypeError: If the arguments do not match the signature.
+    """
+    bound = signature.bind(conn, *args, **kwargs)
+    bound.apply_defaults()
+    query = bound.arguments.get('query')
+    if not query:
+        return None, None
+    key = make_key(query, bound.arguments.get('params'))
+    try:
+        hash(key)
+    except TypeError:
+        return query, None
+    return query, key
+
+def cache_query(func=None, ttl=MISSING, timeout=None):
     """
     A decorator that caches the results of a database query to avoid
-    redundant calls for the same query string.
+    redundant calls for the same query and parameters.
+
+    Results are stored in the bounded LRU query_cache (see cache_store.py)
+    under the normalized query text and its bind parameters, together
+    with the tables the query reads, so that commits through
+    transactional that write to those tables evict them. Use it as
+    @cache_query, or as @cache_query(ttl=60) to give the results their
+    own time to live in seconds (None for no expiry).
+
+    Concurrent misses for the same key are coalesced (see single_flight.py):
+    one caller runs the query and the others, in other threads or asyncio
+    tasks, wait for its result or exception. timeout is the number of
+    seconds they wait before giving up with FlightTimeout. Coroutine
+    functions get an async wrapper.
     """
+    if func is None:
+        return lambda func: cache_query(func, ttl, timeout)
+    signature = inspect.signature(func)
+
+    def cached(query, key):
+        # Check if the query is already in the cache
+        result = query_cache.get(key)
+        if result is not MISSING:
+            print(f"Cache HIT for query: '{query}'")
+        return result
+
+    def recheck(query, key):
+        # A call that finished just before this one took the lead may
+        # have cached the result already
+        result = query_cache.get(key, record=False)
+        if result is MISSING:
+            print(f"Cache MISS for query: '{query}'. Executing...")
+        return result
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            query, key = cache_key(signature, conn, args, kwargs)
+            if query is None:
+                print("No 'query' argument found. Cannot cache.")
+                return "Query not found."
+            if key is None:
+                print(f"Unhashable parameters for query: '{query}'. Not caching.")
+                return await func(conn, *args, **kwargs)
+            result = cached(query, key)
+            if result is not MISSING:
+                return result
+
+            async def load():
+                result = recheck(query, key)
+                if result is MISSING:
+                    tables = tables_read(query)
+                    versions = query_cache.versions(tables)
+                    result = await func(conn, *args, **kwargs)
+                    query_cache.set(key, result, ttl, tables, versions)
+                return result
+            return await query_flights.do_async(key, load, timeout)
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        # The query string is the cache key.
-        # We assume the query is passed as a keyword argument named 'query'.
-        # For a more robust solution, you would handle both args and kwargs
-        query = kwargs.get('query')
-        if not query:
-            # This handles cases where the query might not be in kwargs,
-            # for simplicity we'll assume it's always there for this use case.
-            print("No 'query' argument found in kwargs. Cannot cache.")
+        query, key = cache_key(signature, conn, args, kwargs)
+        if query is None:
+            # This handles cases where the function has no query argument
+            # or it is empty; there is nothing to key the cache on.
+            print("No 'query' argument found. Cannot cache.")
             #return func(conn, *args, **kwargs)
             return "Query not found."
+        if key is None:
+            print(f"Unhashable parameters for query: '{query}'. Not caching.")
+            return func(conn, *args, **kwargs)
+        result = cached(query, key)
+        if result is not MISSING:
+            return result
 
-        # Check if the query is already in the cache
-        if query in query_cache:
-            print(f"Cache HIT for query: '{query}'")
-            return query_cache[query]
-        
-        print(f"Cache MISS for query: '{query}'. Executing...")
-        # Execute the original function if not in cache
-        result = func(conn, *args, **kwargs)
-        
-        # Store the result in the cache
-        query_cache[query] = result
-        return result
+        def load():
+            result = recheck(query, key)
+            if result is MISSING:
+                # Execute the original function if not in cache
+                tables = tables_read(query)
+                versions = query_cache.versions(tables)
+                result = func(conn, *args, **kwargs)
+                # Store the result in the cache, unless a write to its
+                # tables committed while the query ran
+                query_cache.set(key, result, ttl, tables, versions)
+            return result
+        # Only one of the concurrent callers missing this key runs it
+        return query_flights.do(key, load, timeout)
     return wrapper
 
 @with_db_connection
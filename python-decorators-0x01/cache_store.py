@@ -0,0 +1,329 @@
+"""
+A bounded, thread-safe cache for query results.
+
+The cache holds at most max_entries results and about max_bytes of
+them, evicting the least recently used results first, and every result
+expires ttl seconds after it was stored. Results are keyed on the
+normalized SQL text together with its bind parameters.
+
+Each result records the tables its query reads, so a committed write
+can evict exactly the results it may have made stale with
+invalidate_tables(). Table names are found with regular expressions
+applied outside string literals. Results of queries in which no table
+is found are evicted by a write to any table. Tables read through views
+or triggers are not seen; results of such queries are only refreshed by
+their TTL.
+"""
+import collections
+import re
+import sys
+import threading
+import time
+
+# Default limits of the process-wide cache.
+MAX_ENTRIES = 1024
+MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300.0
+
+# Returned by QueryCache.get() when a key is not cached.
+MISSING = object()
+
+# A quoted SQL literal or identifier, or a run of anything else.
+_SQL_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|[^'"`]+""")
+
+# Stands for every table in the tables of a result whose query names no
+# table that tables_read() recognizes.
+ANY_TABLE = "*"
+
+# A possibly quoted and schema-qualified table name.
+_NAME = r"""(?:[`"\[]?[\w$]+[`"\]]?\.)?[`"\[]?[\w$]+[`"\]]?"""
+
+# The table list after FROM runs until the next clause or subquery.
+_FROM_LIST = re.compile(
+    r"\bFROM\s+(.+?)(?=\b(?:WHERE|GROUP|ORDER|HAVING|LIMIT|UNION|EXCEPT|INTERSECT|SELECT"
+    r"|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|ON|USING)\b|[()]|;|$)",
+    re.IGNORECASE | re.DOTALL)
+_JOIN = re.compile(rf"\bJOIN\s+({_NAME})", re.IGNORECASE)
+
+# Statements that change a table's contents or structure.
+_WRITE = re.compile(
+    rf"\b(?:INSERT|REPLACE)\s+(?:OR\s+\w+\s+)?(?:INTO\s+)?({_NAME})"
+    rf"|\bUPDATE\s+(?:OR\s+\w+\s+)?({_NAME})"
+    rf"|\bDELETE\s+FROM\s+({_NAME})"
+    rf"|\b(?:ALTER|DROP|CREATE|TRUNCATE)\s+TABLE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?({_NAME})",
+    re.IGNORECASE)
+
+
+def normalize_sql(query):
+    """
+    Returns a query with runs of whitespace outside quoted strings
+    collapsed to one space, and without surrounding whitespace or a
+    trailing semicolon, so differently formatted copies of the same
+    query share a cache entry.
+    """
+    parts = []
+    for token in _SQL_TOKEN.findall(query):
+        if token[0] in "'\"`":
+            parts.append(token)
+        else:
+            parts.append(re.sub(r"\s+", " ", token))
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def _table_name(name):
+    """
+    Returns a table name without quotes or schema, in lower case.
+    """
+    return name.split(".")[-1].strip("`\"[]").lower()
+
+
+def _without_literals(query):
+    """
+    Returns a query with the contents of its string literals removed, so
+    that text such as 'from x' in a literal is not taken for SQL.
+    Quoted identifiers are kept, as they may be table names.
+    """
+    return "".join("''" if token[0] == "'" else token for token in _SQL_TOKEN.findall(query))
+
+
+def tables_read(query):
+    """
+    Returns the set of tables a query reads: those after FROM or JOIN.
+    """
+    query = _without_literals(query)
+    tables = set()
+    for table_list in _FROM_LIST.findall(query):
+        for table in table_list.split(","):
+            words = table.split()
+            if words and re.fullmatch(_NAME, words[0]):
+                tables.add(_table_name(words[0]))
+    tables.update(_table_name(name) for name in _JOIN.findall(query))
+    return tables
+
+
+def tables_written(statement):
+    """
+    Returns the set of tables a statement inserts into, updates, deletes
+    from, or alters.
+    """
+    statement = _without_literals(statement)
+    return {_table_name(name) for match in _WRITE.findall(statement) for name in match if name}
+
+
+def _freeze(value):
+    """
+    Turns bind parameters into something hashable.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return value
+
+
+def make_key(query, params=()):
+    """
+    Returns the cache key of a query and its bind parameters.
+    """
+    return normalize_sql(query), _freeze(params or ())
+
+
+def approximate_size(value):
+    """
+    Returns the approximate memory used by a query result in bytes,
+    counting the containers and the values in them.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+class QueryCache:
+    """
+    An LRU cache of query results with a per-entry time to live and
+    limits on the number of entries and their total approximate size.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=DEFAULT_TTL):
+        """
+        Args:
+            max_entries (int): The maximum number of cached results.
+            max_bytes (int): The maximum total approximate size of the
+                cached results. A single larger result is not cached.
+            ttl (float): Seconds a result stays valid by default, or None
+                for no expiry.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, size, expires_at, tables)
+        self._entries = collections.OrderedDict()
+        # table -> keys of the results that read it
+        self._readers = collections.defaultdict(set)
+        # table -> number of times it has been invalidated; None counts
+        # the calls to clear()
+        self._versions = collections.Counter()
+        self._bytes = 0
+        self._stats = collections.Counter()
+
+    def get(self, key, default=MISSING, record=True):
+        """
+        Returns the cached result for key and marks it as recently used,
+        or default if it is not cached or has expired. With record=False
+        the lookup is left out of the hit and miss counters, for
+        re-checking a key that was just counted.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += record
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += record
+            return entry[0]
+
+    def versions(self, tables):
+        """
+        Returns a snapshot of the invalidation versions of tables, to
+        take before running a query and pass to set() with its result.
+        """
+        tables = set(map(_table_name, tables)) or {ANY_TABLE}
+        with self._lock:
+            versions = {table: self._versions[table] for table in tables}
+            versions[None] = self._versions[None]
+            return versions
+
+    def set(self, key, value, ttl=MISSING, tables=(), versions=None):
+        """
+        Caches a result, evicting least recently used results as needed
+        to stay within the limits.
+
+        Args:
+            key: The key, as from make_key().
+            value: The result to cache.
+            ttl: Seconds the result stays valid, None for no expiry, or
+                the cache's default if not given.
+            tables: The tables the result was read from, as from
+                tables_read(), for invalidate_tables(). A result with no
+                tables is evicted by an invalidation of any table.
+            versions: The versions() of tables taken before the query
+                ran. If one of them has been invalidated since, a write
+                may have committed while the query ran, and the result
+                is not cached.
+
+        Returns:
+            True if the result was cached, False if it is too large or
+            may be stale.
+        """
+        size = approximate_size(value)
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self._stats["rejections"] += 1
+                return False
+            if versions is not None and any(self._versions[table] != version
+                                            for table, version in versions.items()):
+                self._stats["rejections"] += 1
+                return False
+            tables = frozenset(map(_table_name, tables)) or frozenset((ANY_TABLE,))
+            self._entries[key] = (value, size, expires_at, tables)
+            for table in tables:
+                self._readers[table].add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            return True
+
+    def invalidate(self, key):
+        """
+        Removes a result from the cache.
+
+        Returns:
+            True if it was cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def invalidate_tables(self, tables):
+        """
+        Removes every result read from any of the given tables, and the
+        results whose tables are unknown.
+
+        Returns:
+            The number of results removed.
+        """
+        tables = set(map(_table_name, tables))
+        if tables:
+            tables.add(ANY_TABLE)
+        with self._lock:
+            keys = set()
+            for table in tables:
+                self._versions[table] += 1
+                keys.update(self._readers.get(table, ()))
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """
+        Removes every result; the counters are kept.
+        """
+        with self._lock:
+            self._versions[None] += 1
+            self._entries.clear()
+            self._readers.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns:
+            A dict with the hits, misses, evictions (results dropped to
+            stay within the limits), expirations, rejections (results too
+            large or possibly stale to cache), invalidations (results
+            dropped after writes to their tables), hit_rate, and the current entries and bytes.
+        """
+        with self._lock:
+            stats = {counter: self._stats[counter]
+                     for counter in ("hits", "misses", "evictions", "expirations", "rejections",
+                                     "invalidations")}
+            stats.update(entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        # Called with the lock held
+        _, size, _, tables = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            readers = self._readers[table]
+            readers.discard(key)
+            if not readers:
+                del self._readers[table]
+
+
+# The process-wide cache used by cache_query.
+query_cache = QueryCache()
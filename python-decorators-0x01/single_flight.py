@@ -0,0 +1,175 @@
+"""
+Coalescing of concurrent calls for the same key ("single flight").
+
+When several callers ask for the same key at once, the first one (the
+leader) runs the function and the others wait for its outcome: they all
+get the leader's result, or its exception is raised in each of them.
+This keeps a burst of cache misses for one query from running the query
+once per caller. Threads and asyncio tasks are coalesced separately.
+"""
+import asyncio
+import collections
+import threading
+
+
+class FlightTimeout(TimeoutError):
+    """
+    Raised in a waiting caller when the in-flight call for its key did
+    not finish within its timeout.
+    """
+
+
+class _Flight:
+    """
+    An in-flight call, shared by the threads waiting for it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing its outcome with
+    the callers that arrive while it runs. Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        # (event loop, key) -> asyncio.Future of the in-flight call
+        self._async_flights = {}
+        self._stats = collections.Counter()
+
+    def do(self, key, function, timeout=None):
+        """
+        Calls function() unless a call for key is already running in
+        another thread, in which case its outcome is waited for.
+
+        Args:
+            key: The hashable key identifying the call.
+            function: The function to run, without arguments.
+            timeout (float): Seconds to wait for an in-flight call, or
+                None to wait as long as it takes. The leader itself is
+                not limited.
+
+        Returns:
+            The result of the leader's call.
+
+        Raises:
+            FlightTimeout: If the in-flight call did not finish in time.
+            The exception raised by the leader's call, if any.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                flight.result = function()
+            except BaseException as err:
+                flight.error = err
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        elif not flight.done.wait(timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise FlightTimeout(f"in-flight call for {key!r} did not finish within {timeout}s")
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    async def do_async(self, key, function, timeout=None):
+        """
+        The asyncio version of do(): awaits function() unless a call for
+        key is already running in another task of the same event loop,
+        in which case its outcome is awaited.
+
+        If the leader is cancelled, one of the waiting tasks that is not
+        being cancelled itself runs the call instead; cancelling a
+        waiting task does not affect the others.
+
+        Args:
+            key: The hashable key identifying the call.
+            function: A coroutine function to await, without arguments.
+            timeout (float): Seconds to wait for an in-flight call, or
+                None to wait as long as it takes.
+
+        Returns:
+            The result of the leader's call.
+
+        Raises:
+            FlightTimeout: If the in-flight call did not finish in time.
+            The exception raised by the leader's call, if any.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        while True:
+            with self._lock:
+                flight = self._async_flights.get(flight_key)
+                if flight is None:
+                    flight = self._async_flights[flight_key] = loop.create_future()
+                    self._stats["calls"] += 1
+                    break
+                self._stats["coalesced"] += 1
+            try:
+                # shield() keeps a waiter's timeout or cancellation from
+                # cancelling the shared future
+                await asyncio.wait_for(asyncio.shield(flight), timeout)
+            except asyncio.TimeoutError:
+                if not flight.done():
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise FlightTimeout(
+                        f"in-flight call for {key!r} did not finish within {timeout}s") from None
+            except asyncio.CancelledError:
+                # Take over only if the leader alone was cancelled; a waiter
+                # cancelled itself (e.g. with its TaskGroup) stays cancelled
+                if not flight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            except BaseException:
+                pass
+            if not flight.cancelled():
+                # The leader's result, or its exception re-raised
+                return flight.result()
+            # The leader was cancelled; try to take over
+
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as err:
+            flight.set_exception(err)
+            # Mark the exception as retrieved when nobody was waiting
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._async_flights[flight_key]
+
+    def stats(self):
+        """
+        Returns:
+            A dict with the number of calls run, of callers coalesced
+            into an in-flight call, and of waits that timed out.
+        """
+        with self._lock:
+            return {counter: self._stats[counter] for counter in ("calls", "coalesced", "timeouts")}
+
+
+# The process-wide coalescer used by cache_query.
+query_flights = SingleFlight()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test module for the table tracking of cache_store.
+"""
+import unittest
+from cache_store import MISSING, QueryCache, make_key, tables_read, tables_written
+
+
+class TestTablesRead(unittest.TestCase):
+    """Tests the tables_read function."""
+
+    def test_tables_read(self):
+        """Tests that the tables after FROM and JOIN are found."""
+        cases = [
+            ("SELECT * FROM users", {"users"}),
+            ("SELECT a FROM t1, t2 AS b WHERE 1", {"t1", "t2"}),
+            ('select u.id from "Users" u join main.orders o on o.user_id = u.id '
+             'where u.id in (select id from banned)', {"users", "orders", "banned"}),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(tables_read(query), expected)
+
+    def test_tables_read_ignores_string_literals(self):
+        """Tests that SQL inside a string literal is not parsed."""
+        query = "SELECT email, 'from x' AS note FROM users WHERE id = ?"
+        self.assertEqual(tables_read(query), {"users"})
+        self.assertEqual(tables_read("SELECT 'a '' from x' FROM users"), {"users"})
+
+    def test_tables_written_ignores_string_literals(self):
+        """Tests that a literal in a write does not hide or add tables."""
+        statement = "UPDATE users SET note = 'delete from orders' WHERE id = 1"
+        self.assertEqual(tables_written(statement), {"users"})
+
+
+class TestInvalidateTables(unittest.TestCase):
+    """Tests QueryCache.invalidate_tables."""
+
+    def test_invalidates_readers_of_written_table(self):
+        """Tests that only the results reading a written table are evicted."""
+        cache = QueryCache()
+        users = make_key("SELECT email, 'from x' AS note FROM users WHERE id = ?", (1,))
+        orders = make_key("SELECT * FROM orders")
+        cache.set(users, [("a@x", "from x")], tables=tables_read(users[0]))
+        cache.set(orders, [], tables=tables_read(orders[0]))
+        self.assertEqual(cache.invalidate_tables(tables_written(
+            "UPDATE users SET email = ? WHERE id = ?")), 1)
+        self.assertIsNot(cache.get(orders), MISSING)
+        self.assertFalse(cache.invalidate(users))
+
+    def test_result_without_tables_is_evicted_by_any_write(self):
+        """Tests that a result with unknown tables is evicted by any write."""
+        cache = QueryCache()
+        key = make_key("SELECT 1")
+        cache.set(key, [(1,)], tables=tables_read(key[0]))
+        self.assertEqual(cache.invalidate_tables(set()), 0)
+        self.assertEqual(cache.invalidate_tables({"users"}), 1)
+
+    def test_result_without_tables_is_not_cached_after_a_write(self):
+        """Tests that a write during the query prevents caching it."""
+        cache = QueryCache()
+        versions = cache.versions(set())
+        cache.invalidate_tables({"users"})
+        self.assertFalse(cache.set(make_key("SELECT 1"), [(1,)], versions=versions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Test module for single_flight.SingleFlight.
+"""
+import asyncio
+import threading
+import time
+import unittest
+from single_flight import FlightTimeout, SingleFlight
+
+
+def wait_until(condition, timeout=2.0):
+    """Polls condition until it is true or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+class TestDo(unittest.TestCase):
+    """Tests the coalescing of threads by SingleFlight.do."""
+
+    def run_threads(self, flights, function, count, **kwargs):
+        """Calls flights.do from count threads once they have all joined
+        the leader's flight, and returns their results or exceptions."""
+        release = threading.Event()
+        outcomes = [None] * count
+
+        def blocked():
+            release.wait()
+            return function()
+
+        def call(i):
+            try:
+                outcomes[i] = flights.do("key", blocked, **kwargs)
+            except Exception as err:
+                outcomes[i] = err
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(wait_until(lambda: flights.stats()["coalesced"] == count - 1))
+        release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_concurrent_calls_run_once(self):
+        """Tests that N threads asking for one key share one call."""
+        flights = SingleFlight()
+        calls = []
+        outcomes = self.run_threads(flights, lambda: calls.append(1) or "rows", 8)
+        self.assertEqual(outcomes, ["rows"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats(), {"calls": 1, "coalesced": 7, "timeouts": 0})
+
+    def test_leader_error_is_raised_in_every_caller(self):
+        """Tests that the leader's exception is raised in all waiters."""
+        error = ValueError("query failed")
+
+        def fail():
+            raise error
+        outcomes = self.run_threads(SingleFlight(), fail, 4)
+        self.assertEqual(outcomes, [error] * 4)
+
+    def test_waiter_times_out_while_leader_finishes(self):
+        """Tests that a waiter raises FlightTimeout and the leader is unaffected."""
+        flights = SingleFlight()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            release.wait()
+            return "rows"
+        leader = threading.Thread(target=lambda: results.append(flights.do("key", slow)))
+        leader.start()
+        self.assertTrue(wait_until(lambda: flights.stats()["calls"] == 1))
+        with self.assertRaises(FlightTimeout):
+            flights.do("key", slow, timeout=0.05)
+        release.set()
+        leader.join()
+        self.assertEqual(results, ["rows"])
+        self.assertEqual(flights.stats()["timeouts"], 1)
+
+    def test_later_call_runs_again(self):
+        """Tests that calls after the flight has landed are not coalesced."""
+        flights = SingleFlight()
+        calls = []
+        flights.do("key", lambda: calls.append(1))
+        flights.do("key", lambda: calls.append(1))
+        self.assertEqual(len(calls), 2)
+
+
+class TestDoAsync(unittest.TestCase):
+    """Tests the coalescing of asyncio tasks by SingleFlight.do_async."""
+
+    def test_concurrent_tasks_run_once(self):
+        """Tests that tasks asking for one key share one call."""
+        flights = SingleFlight()
+        calls = []
+
+        async def query():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "rows"
+
+        async def main():
+            return await asyncio.gather(*(flights.do_async("key", query) for _ in range(5)))
+        self.assertEqual(asyncio.run(main()), ["rows"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiter_takes_over_from_cancelled_leader(self):
+        """Tests that a waiter runs the call when only the leader is cancelled."""
+        flights = SingleFlight()
+        calls = []
+
+        async def query():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.Event().wait()
+            return "rows"
+
+        async def main():
+            leader = asyncio.create_task(flights.do_async("key", query))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(flights.do_async("key", query))
+            await asyncio.sleep(0)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await waiter
+        self.assertEqual(asyncio.run(main()), "rows")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flights._async_flights, {})
+
+    def test_cancelling_leader_and_waiters_does_not_rerun(self):
+        """Tests that waiters cancelled with their leader do not take over."""
+        flights = SingleFlight()
+        calls = []
+
+        async def query():
+            calls.append(1)
+            await asyncio.Event().wait()
+
+        async def with_gather():
+            tasks = asyncio.gather(*(flights.do_async("key", query) for _ in range(3)))
+            await asyncio.sleep(0.01)
+            tasks.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await tasks
+
+        async def with_task_group():
+            async def cancel_group():
+                await asyncio.sleep(0.01)
+                raise ValueError("stop")
+            with self.assertRaises(ExceptionGroup):
+                async with asyncio.TaskGroup() as group:
+                    for _ in range(3):
+                        group.create_task(flights.do_async("key", query))
+                    group.create_task(cancel_group())
+
+        mains = [with_gather]
+        if hasattr(asyncio, "TaskGroup"):
+            mains.append(with_task_group)
+        for main in mains:
+            with self.subTest(main=main.__name__):
+                calls.clear()
+                asyncio.run(main())
+                self.assertEqual(len(calls), 1)
+                self.assertEqual(flights._async_flights, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,38 +1,43 @@
-import mysql.connector
-from seed import connect_to_prodev
+from seed import DB_ERRORS, STREAM_FETCH_SIZE, CompactUser, connect_to_prodev, stream_batches
 
 TABLE_NAME = "user_data"
 
-def stream_users():
+def stream_users(fetch_size=STREAM_FETCH_SIZE, compact=False):
     """
     A generator function that streams rows from the 'user_data' table
-    one by one, to conserve memory.
+    one by one, to conserve memory. Rows are read from an unbuffered
+    cursor fetch_size at a time, so the whole table is never held in
+    client memory.
 
     Args:
-        connection: The database connection object.
+        fetch_size: The number of rows fetched per round trip.
+        compact: Yield seed.CompactUser objects instead of tuples.
 
     Yields:
-        A tuple representing a single row from the database.
+        A tuple (or CompactUser) representing a single row from the database.
     """
-    cursor = None
+    connection = None
+    stream = None
     try:
-        # Use buffered=True for fetching rows one at a time for large datasets
         connection = connect_to_prodev()
-        cursor = connection.cursor(buffered=True)
-        query = f"SELECT * FROM {TABLE_NAME}"
-        cursor.execute(query)
-        
-        while True:
-            row = cursor.fetchone()
-            if row is None:
-                # No more rows to fetch, stop the generator
-                break
-            yield row
-    except mysql.connector.Error as err:
+        if not connection:
+            return
+        # The connection is ours, so on an early break it is closed
+        # rather than drained of the rows nobody will read.
+        stream = stream_batches(connection, f"SELECT * FROM {TABLE_NAME}",
+                                fetch_size=fetch_size, drain=False)
+        for batch in stream:
+            if compact:
+                yield from map(CompactUser.from_row, batch)
+            else:
+                yield from batch
+    except DB_ERRORS as err:
         print(f"Error streaming data: {err}")
     finally:
-        if cursor:
-            cursor.close()
+        if stream:
+            stream.close()
+        if connection:
+            connection.close()
 
 
 if __name__ == "__main__":
@@ -43,7 +48,9 @@ if __name__ == "__main__":
     for i, row in enumerate(data_stream):
         print(f"Streaming Row {i+1}: {row}")
         if i > 5: break
-    
+    # Stopping early closes the generator, which closes its connection
+    data_stream.close()
+
     # Close the database connection when finished
     print("\nDatabase connection closed.")
 
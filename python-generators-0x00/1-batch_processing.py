@@ -1,26 +1,84 @@
-from seed import connect_to_prodev
+from array import array
 
-def stream_users_in_batches(batch_size):
+from seed import DB_ERRORS, USER_COLUMNS, build_select, connect_to_prodev, stream_batches
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; columnar batches fall back to array.array
+    numpy = None
+
+# Columns stored as float64 arrays in columnar batches; the others are text.
+NUMERIC_COLUMNS = ("age",)
+
+def to_columns(batch, columns=None):
+    """
+    Converts a batch of row tuples into one typed array per column.
+
+    Numeric columns become float64 arrays (numpy.ndarray when numpy is
+    installed, array.array('d') otherwise), so filters and aggregates can
+    run vectorized. Text columns become numpy unicode arrays, or tuples
+    of str without numpy.
+
+    Args:
+        batch: A list of row tuples.
+        columns: The column names of the rows, or None for USER_COLUMNS.
+
+    Returns:
+        A dict mapping each column name to its array.
+    """
+    columns = tuple(columns) if columns else USER_COLUMNS
+    values = list(zip(*batch)) if batch else [()] * len(columns)
+    result = {}
+    for name, column in zip(columns, values):
+        if name in NUMERIC_COLUMNS:
+            if numpy is not None:
+                result[name] = numpy.fromiter(map(float, column), dtype=numpy.float64, count=len(column))
+            else:
+                result[name] = array('d', map(float, column))
+        elif numpy is not None:
+            result[name] = numpy.array(column, dtype=str)
+        else:
+            result[name] = column
+    return result
+
+def stream_users_in_batches(batch_size, columns=None, where=None, columnar=False):
+    """
+    A generator that streams users from the database in batches.
+
+    The column list and filter are compiled into the SELECT statement
+    (see seed.build_select), so only the matching rows and the requested
+    columns cross the wire.
+
+    Args:
+        batch_size: The number of rows per batch.
+        columns: The columns to fetch, or None for all of them.
+        where: A list of (column, operator, value) conditions, or None.
+        columnar: Yield each batch as a dict of per-column arrays (see
+            to_columns) instead of a list of tuples.
+
+    Yields:
+        A list of up to batch_size row tuples, or a dict of column arrays
+        when columnar is True.
+    """
+    query, params = build_select(columns, where)
     conn = None
-    cursor = None
+    stream = None
     try:
         conn = connect_to_prodev()
         if not conn:
             return
-        cursor = conn.cursor(buffered=True)
-        cursor.execute(f"SELECT * FROM user_data")
-        
-        while True:
-            # fetchmany() fetches a chunk of rows at a time
-            batch = cursor.fetchmany(batch_size)
-            if not batch:
-                break
-            yield batch
-    except mysql.connector.Error as err:
+        # fetchmany() fetches a chunk of rows at a time
+        stream = stream_batches(conn, query, params, fetch_size=batch_size, drain=False)
+        if not columnar:
+            yield from stream
+        else:
+            for batch in stream:
+                yield to_columns(batch, columns)
+    except DB_ERRORS as err:
         print(f"Error streaming batches: {err}")
     finally:
-        if cursor:
-            cursor.close()
+        if stream:
+            stream.close()
         if conn:
             conn.close()
 
@@ -33,15 +91,12 @@ def batch_processing(batch_size):
     """
     print(f"\n--- Processing Users in Batches (Age > 25) ---")
     
-    # Outer loop to iterate over each batch from the generator
-    for batch in stream_users_in_batches(batch_size):
+    # The age filter runs in the database, so every streamed row matches
+    for batch in stream_users_in_batches(batch_size, where=[("age", ">", 25)]):
         print(f"Processing a new batch of {len(batch)} users...")
-        
-        # Inner loop to process each user in the current batch
+
         for user_row in batch:
-            user_id, name, email, age = user_row
-            if age > 25:
-                print(user_row)
+            print(user_row)
 
 if __name__ == "__main__":
     # 1. Demonstrate the new batch processing function
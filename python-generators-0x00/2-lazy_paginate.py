@@ -1,63 +1,240 @@
-from seed import connect_to_prodev
+from seed import DB_ERRORS, USER_COLUMNS, USER_DATA_INDEXES, connect_to_prodev
 
-def paginate_users(page_size, offset):
+# Columns that may be used as the keyset sort key: the primary key and
+# the columns with a (column, user_id) index created by seed.create_table.
+# user_id is always appended as a tiebreaker so that pages come back in
+# a stable order.
+KEYSET_SORT_KEYS = ("user_id",) + tuple(
+    column for column in USER_COLUMNS if column in USER_DATA_INDEXES)
+
+OFFSET_QUERY = "SELECT * FROM user_data LIMIT %s OFFSET %s"
+
+def fetch_page(query, params, cursor=None):
     """
-    Fetches a single page of data from the user_data table.
+    Runs a page query and returns all of its rows. With a cursor, the
+    query runs on it (and on its connection); without one, a connection
+    is opened for this page only and closed again.
 
     Args:
-        page_size: The number of rows to fetch.
-        offset: The starting row for the fetch.
+        query: The page query.
+        params: The query parameters.
+        cursor: An open cursor to reuse, or None.
 
     Returns:
-        A list of tuples representing the rows for the requested page.
+        A list of tuples representing the rows of the page.
     """
+    if cursor is not None:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
     conn = None
-    cursor = None
     try:
         conn = connect_to_prodev()
         if not conn:
             return []
         cursor = conn.cursor()
-        # Use LIMIT and OFFSET to fetch a specific page of data
-        query = f"SELECT * FROM user_data LIMIT %s OFFSET %s"
-        cursor.execute(query, (page_size, offset))
+        cursor.execute(query, params)
         return cursor.fetchall()
-    except mysql.connector.Error as err:
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+def paginate_users(page_size, offset, cursor=None):
+    """
+    Fetches a single page of data from the user_data table.
+
+    Args:
+        page_size: The number of rows to fetch.
+        offset: The starting row for the fetch.
+        cursor: An open cursor to reuse, or None to open a connection
+            for this page only.
+
+    Returns:
+        A list of tuples representing the rows for the requested page.
+    """
+    try:
+        # Use LIMIT and OFFSET to fetch a specific page of data
+        return fetch_page(OFFSET_QUERY, (page_size, offset), cursor)
+    except DB_ERRORS as err:
         print(f"Error fetching paginated data: {err}")
         return []
+
+def keyset_query(sort_key="user_id", first_page=False):
+    """
+    Builds the keyset page query for a sort key.
+
+    Args:
+        sort_key: The column to order by, one of KEYSET_SORT_KEYS.
+        first_page: Whether the query is for the first page, which has
+            no previous key to seek past.
+
+    Returns:
+        The SQL query string.
+    """
+    if sort_key not in KEYSET_SORT_KEYS:
+        raise ValueError(f"Unsupported keyset sort key: {sort_key!r}")
+    order_by = "user_id" if sort_key == "user_id" else f"{sort_key}, user_id"
+    if first_page:
+        where = ""
+    elif sort_key == "user_id":
+        where = "WHERE user_id > %s"
+    else:
+        where = f"WHERE ({sort_key}, user_id) > (%s, %s)"
+    return f"SELECT * FROM user_data {where} ORDER BY {order_by} LIMIT %s"
+
+def paginate_users_keyset(page_size, last_key=None, sort_key="user_id", cursor=None):
+    """
+    Fetches the page of users that follows last_key, ordered by sort_key.
+    Unlike LIMIT/OFFSET, the server seeks straight to last_key through the
+    index, so every page costs the same no matter how deep it is.
+
+    Args:
+        page_size: The number of rows to fetch.
+        last_key: The key of the last row of the previous page, as
+            returned by keyset_key(), or None for the first page.
+        sort_key: The column to order by, one of KEYSET_SORT_KEYS.
+        cursor: An open cursor to reuse, or None to open a connection
+            for this page only.
+
+    Returns:
+        A list of tuples representing the rows for the requested page.
+    """
+    query = keyset_query(sort_key, first_page=last_key is None)
+    params = (tuple(last_key) if last_key is not None else ()) + (page_size,)
+    try:
+        return fetch_page(query, params, cursor)
+    except DB_ERRORS as err:
+        print(f"Error fetching keyset page: {err}")
+        return []
+
+def keyset_key(row, sort_key="user_id"):
+    """
+    Returns the keyset position of a user_data row.
+
+    Args:
+        row: A (user_id, name, email, age) tuple.
+        sort_key: The column the pages are ordered by.
+
+    Returns:
+        A tuple that can be passed as last_key to paginate_users_keyset.
+    """
+    user_id = row[0]
+    if sort_key == "user_id":
+        return (user_id,)
+    return (row[USER_COLUMNS.index(sort_key)], user_id)
+
+def page_stats():
+    """
+    Returns a fresh stats dict for lazy_paginate/lazy_paginate_keyset.
+
+    Keys:
+        connections: Connections opened for the iteration.
+        pages: Pages fetched.
+        rows: Rows fetched.
+        connections_per_page: connections / pages.
+    """
+    return {"connections": 0, "pages": 0, "rows": 0, "connections_per_page": 0.0}
+
+def paginate_session(fetch, stats=None):
+    """
+    Drives a page fetcher over one connection and one prepared cursor,
+    which are reused for every page and released when the generator is
+    exhausted, closed or garbage-collected.
+
+    Args:
+        fetch: A function (cursor, previous_page) -> page that returns
+            an empty page when there are no more rows.
+        stats: An optional dict from page_stats() to update.
+
+    Yields:
+        A list of tuples representing a page of users.
+    """
+    if stats is None:
+        stats = page_stats()
+    conn = None
+    cursor = None
+    try:
+        conn = connect_to_prodev()
+        if not conn:
+            return
+        stats["connections"] += 1
+        # A prepared cursor parses each page query once on the server and
+        # only sends the parameters for the following pages.
+        cursor = conn.cursor(prepared=True)
+        page = None
+        while True:
+            page = fetch(cursor, page)
+            if not page:
+                break
+            stats["pages"] += 1
+            stats["rows"] += len(page)
+            stats["connections_per_page"] = stats["connections"] / stats["pages"]
+            yield page
     finally:
         if cursor:
             cursor.close()
         if conn:
             conn.close()
 
-def lazy_paginate(page_size):
+def lazy_paginate_keyset(page_size, sort_key="user_id", stats=None):
+    """
+    A generator that lazily loads pages of users using keyset (seek)
+    pagination: each page continues from the last row of the previous one.
+    All pages are read over a single connection.
+
+    Args:
+        page_size: The number of users to fetch per page.
+        sort_key: The indexed column to order by, one of KEYSET_SORT_KEYS.
+        stats: An optional dict from page_stats() to update.
+
+    Yields:
+        A list of tuples representing a page of users.
+    """
+    def fetch(cursor, previous):
+        if previous is None:
+            return paginate_users_keyset(page_size, None, sort_key, cursor)
+        if len(previous) < page_size:
+            # A short page is the last one; skip the empty round trip
+            return []
+        last_key = keyset_key(previous[-1], sort_key)
+        return paginate_users_keyset(page_size, last_key, sort_key, cursor)
+
+    yield from paginate_session(fetch, stats)
+
+def lazy_paginate(page_size, stats=None):
     """
     A generator that lazily loads pages of data from the database.
+    All pages are read over a single connection.
 
     Args:
         page_size: The number of users to fetch per page.
+        stats: An optional dict from page_stats() to update.
 
     Yields:
         A list of tuples representing a page of users.
     """
     offset = 0
-    while True:
-        page = paginate_users(page_size, offset)
-        if not page:
-            # Stop the generator when there are no more pages
-            break
-        yield page
-        offset += page_size
+
+    def fetch(cursor, previous):
+        nonlocal offset
+        if previous is not None:
+            offset += page_size
+        return paginate_users(page_size, offset, cursor)
+
+    yield from paginate_session(fetch, stats)
 
 
 if __name__ == "__main__":
     # 1. Demonstrate the new batch processing function
     # 7. Demonstrate the new lazy pagination generator
     print("\n--- Demonstrating Lazy Pagination with Generator ---")
-    page_generator = lazy_paginate(page_size=2)
-    
+    stats = page_stats()
+    page_generator = lazy_paginate(page_size=2, stats=stats)
+
     for i, page in enumerate(page_generator):
         print(f"--- Fetched Page {i+1} ---")
         for user_row in page:
             print(user_row)
+    print(f"\n{stats['pages']} pages over {stats['connections']} connection(s)")
@@ -1,4 +1,32 @@
-from seed import connect_to_prodev
+import decimal
+from decimal import Decimal
+
+from seed import DB_ERRORS, connect_to_prodev, stream_batches
+from sketches import HyperLogLog, Histogram, QuantileSketch
+
+# Context for the accumulator's running sums. With the maximum precision
+# and exponent range, additions and multiplications of finite Decimals
+# are exact; Inexact is trapped so that can never silently change.
+EXACT_CONTEXT = decimal.Context(
+    prec=decimal.MAX_PREC,
+    Emax=decimal.MAX_EMAX,
+    Emin=decimal.MIN_EMIN,
+    traps=[decimal.Inexact, decimal.InvalidOperation, decimal.Overflow],
+)
+
+# The aggregate query pushed down to the database. Sums of the DECIMAL
+# age column are exact on the server, and the standard deviation is
+# derived from them so the query runs on any SQL backend.
+AGGREGATE_QUERY = (
+    "SELECT COUNT(age), SUM(age), SUM(age * age), MIN(age), MAX(age) "
+    "FROM user_data"
+)
+
+# Bucket edges of the age histogram: decades from 0 to 130.
+AGE_HISTOGRAM_EDGES = tuple(range(0, 131, 10))
+
+# Quantiles reported by AgeSummary.
+AGE_QUANTILES = (0.5, 0.9, 0.99)
 
 def stream_user_ages():
     """
@@ -8,24 +36,255 @@ def stream_user_ages():
         A single age (Decimal) from each row.
     """
     conn = None
-    cursor = None
+    stream = None
     try:
         conn = connect_to_prodev()
         if not conn:
             return
-        
-        cursor = conn.cursor(buffered=True)
-        query = f"SELECT age FROM user_data"
-        cursor.execute(query)
-        
-        while True:
-            row = cursor.fetchone()
-            if row is None:
-                break
-            # Yields the age from the single-element tuple
-            yield row[0]
-    except mysql.connector.Error as err:
+
+        stream = stream_batches(conn, "SELECT age FROM user_data", drain=False)
+        for batch in stream:
+            for row in batch:
+                # Yields the age from the single-element tuple
+                yield row[0]
+    except DB_ERRORS as err:
         print(f"Error streaming ages: {err}")
+    finally:
+        if stream:
+            stream.close()
+        if conn:
+            conn.close()
+
+def to_decimal(value):
+    """
+    Converts an age to a Decimal without rounding.
+
+    Args:
+        value: A Decimal, int, float or numeric string.
+
+    Returns:
+        The exact Decimal value.
+    """
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, str):
+        return EXACT_CONTEXT.create_decimal(value)
+    # Decimal(float) is the exact binary value of the float
+    return Decimal(value)
+
+class AgeAccumulator:
+    """
+    A single-pass accumulator for count, mean, min, max and population
+    standard deviation.
+
+    It keeps the count and the exact sum and sum of squares of the values,
+    so the result is Decimal-exact up to the final division and square
+    root, and does not suffer the cancellation that makes the textbook
+    float formula unstable. Memory use is constant in the number of
+    values, and two accumulators can be merged, e.g. the partial results
+    of a partitioned scan.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = Decimal(0)
+        self.total_squares = Decimal(0)
+        self.minimum = None
+        self.maximum = None
+
+    @classmethod
+    def from_totals(cls, count, total, total_squares, minimum, maximum):
+        """
+        Builds an accumulator from aggregates computed elsewhere, e.g. by
+        the database.
+        """
+        accumulator = cls()
+        accumulator.count = int(count or 0)
+        if accumulator.count:
+            accumulator.total = to_decimal(total)
+            accumulator.total_squares = to_decimal(total_squares)
+            accumulator.minimum = to_decimal(minimum)
+            accumulator.maximum = to_decimal(maximum)
+        return accumulator
+
+    def add(self, age):
+        """
+        Adds a single value.
+        """
+        age = to_decimal(age)
+        self.count += 1
+        self.total = EXACT_CONTEXT.add(self.total, age)
+        self.total_squares = EXACT_CONTEXT.fma(age, age, self.total_squares)
+        if self.minimum is None or age < self.minimum:
+            self.minimum = age
+        if self.maximum is None or age > self.maximum:
+            self.maximum = age
+
+    def update(self, ages):
+        """
+        Adds every value of an iterable, consuming it lazily.
+
+        Returns:
+            The accumulator, for chaining.
+        """
+        add = self.add
+        for age in ages:
+            add(age)
+        return self
+
+    def merge(self, other):
+        """
+        Folds another accumulator into this one.
+
+        Returns:
+            The accumulator, for chaining.
+        """
+        if not other.count:
+            return self
+        self.count += other.count
+        self.total = EXACT_CONTEXT.add(self.total, other.total)
+        self.total_squares = EXACT_CONTEXT.add(self.total_squares, other.total_squares)
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+        return self
+
+    def result(self):
+        """
+        Returns:
+            A dict with count, avg, min, max and stddev. avg and stddev
+            are rounded to the current decimal context; all values are
+            None when nothing was added.
+        """
+        if not self.count:
+            return {"count": 0, "avg": None, "min": None, "max": None, "stddev": None}
+        n = Decimal(self.count)
+        # n * sum(x^2) - sum(x)^2, computed exactly, is n^2 * variance
+        spread = EXACT_CONTEXT.subtract(
+            EXACT_CONTEXT.multiply(n, self.total_squares),
+            EXACT_CONTEXT.multiply(self.total, self.total),
+        )
+        variance = spread / (n * n)
+        return {
+            "count": self.count,
+            "avg": self.total / n,
+            "min": self.minimum,
+            "max": self.maximum,
+            "stddev": variance.sqrt(),
+        }
+
+class AgeSummary:
+    """
+    One-pass, bounded-memory summary of a stream of ages: the exact
+    AgeAccumulator statistics plus the median/p90/p99 from a
+    QuantileSketch, a fixed-bucket Histogram and a HyperLogLog distinct
+    count. Summaries of partitions of the data can be merged.
+    """
+
+    def __init__(self, edges=AGE_HISTOGRAM_EDGES, k=200, precision=12):
+        self.moments = AgeAccumulator()
+        self.quantile_sketch = QuantileSketch(k)
+        self.histogram = Histogram(edges)
+        self.distinct = HyperLogLog(precision)
+
+    def add(self, age):
+        """
+        Adds a single age.
+        """
+        self.moments.add(age)
+        self.quantile_sketch.add(age)
+        self.histogram.add(age)
+        self.distinct.add(age)
+
+    def update(self, ages):
+        """
+        Adds every age of an iterable, consuming it lazily.
+
+        Returns:
+            The summary, for chaining.
+        """
+        add = self.add
+        for age in ages:
+            add(age)
+        return self
+
+    def merge(self, other):
+        """
+        Folds another AgeSummary, built with the same settings, into this one.
+
+        Returns:
+            The summary, for chaining.
+        """
+        self.moments.merge(other.moments)
+        self.quantile_sketch.merge(other.quantile_sketch)
+        self.histogram.merge(other.histogram)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def result(self, quantiles=AGE_QUANTILES):
+        """
+        Returns:
+            The AgeAccumulator.result() dict plus "quantiles" (a dict from
+            fraction to estimated age), "histogram" (a list of
+            (low, high, count)), "histogram_underflow" and
+            "histogram_overflow" (the counts of ages below the first and
+            at or above the last edge, so that all counts add up to
+            "count") and "distinct" (the estimated number of distinct
+            ages).
+        """
+        result = self.moments.result()
+        result["quantiles"] = dict(zip(quantiles, self.quantile_sketch.quantiles(quantiles)))
+        result["histogram"] = self.histogram.buckets()
+        result["histogram_underflow"] = self.histogram.underflow
+        result["histogram_overflow"] = self.histogram.overflow
+        result["distinct"] = self.distinct.count()
+        return result
+
+def summarize_ages(ages=None):
+    """
+    Summarizes user ages in a single pass over stream_user_ages(), or over
+    the given iterable of ages, without materializing them.
+
+    Returns:
+        The AgeSummary.result() dict.
+    """
+    if ages is None:
+        ages = stream_user_ages()
+    return AgeSummary().update(ages).result()
+
+def aggregate_ages(ages=None):
+    """
+    Computes count, avg, min, max and population stddev of user ages.
+
+    Without an argument the aggregation is pushed down to the database,
+    so only one row crosses the wire. Given an iterable of ages (e.g. an
+    already filtered stream) it falls back to a single pass of
+    AgeAccumulator, which never materializes the values.
+
+    Args:
+        ages: An optional iterable of ages to aggregate instead of the
+            whole user_data table.
+
+    Returns:
+        A dict as returned by AgeAccumulator.result(), or None if the
+        database could not be queried.
+    """
+    if ages is not None:
+        return AgeAccumulator().update(ages).result()
+
+    conn = None
+    cursor = None
+    try:
+        conn = connect_to_prodev()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        cursor.execute(AGGREGATE_QUERY)
+        return AgeAccumulator.from_totals(*cursor.fetchone()).result()
+    except DB_ERRORS as err:
+        print(f"Error aggregating ages: {err}")
+        return None
     finally:
         if cursor:
             cursor.close()
@@ -34,19 +293,15 @@ def stream_user_ages():
 
 def calculate_average_age():
     """
-    Calculates the average age of all users using the generator.
-    """
-    total_age = 0
-    user_count = 0
-    
-    # This is the first and only loop for the calculation
-    for age in stream_user_ages():
-        total_age += age
-        user_count += 1
-        
-    if user_count > 0:
-        average_age = total_age / user_count
-        print(f"Average age of users: {average_age:.2f}")
+    Calculates the average age of all users, letting the database do
+    the aggregation.
+    """
+    stats = aggregate_ages()
+    if stats is None:
+        return
+
+    if stats["count"] > 0:
+        print(f"Average age of users: {stats['avg']:.2f}")
     else:
         print("No users found to calculate average age.")
 
@@ -0,0 +1,214 @@
+"""
+Async generator versions of the user streaming functions.
+
+They run on aiomysql and share one bounded connection pool per event
+loop, so many concurrent streams can run on a single loop. Rows are read
+from server-side (unbuffered) cursors only as fast as the consumer pulls
+them, which gives natural backpressure. Use contextlib.aclosing() (or
+let the stream run to the end) so that early exits and cancellations
+return the connection to the pool promptly.
+"""
+import asyncio
+import contextlib
+
+import aiomysql
+
+import seed
+
+# Size limits of each event loop's connection pool.
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+
+# The pool of each event loop, and the lock guarding its creation. A pool
+# and its connections are bound to the loop they were created on, so a
+# later asyncio.run() gets a new pool. Entries of closed loops are
+# dropped when the next pool is looked up.
+_pools = {}
+_pool_locks = {}
+
+
+def _pool_lock(loop):
+    for closed in [other for other in _pool_locks if other.is_closed()]:
+        # A closed loop can no longer run its pool's close()
+        _pools.pop(closed, None)
+        del _pool_locks[closed]
+    lock = _pool_locks.get(loop)
+    if lock is None:
+        lock = _pool_locks[loop] = asyncio.Lock()
+    return lock
+
+
+async def get_pool(minsize=POOL_MIN_SIZE, maxsize=POOL_MAX_SIZE):
+    """
+    Returns the running event loop's connection pool, creating it on
+    first use. When all maxsize connections are checked out, new streams
+    wait for one to be released.
+
+    Connections run in autocommit mode: with autocommit off, every
+    SELECT would open a transaction and aiomysql closes connections
+    released in a transaction, so each stream would reconnect.
+
+    Args:
+        minsize: The number of connections kept open.
+        maxsize: The maximum number of connections.
+
+    Returns:
+        An aiomysql.Pool.
+    """
+    backend = seed.get_current_backend()
+    if backend.name != "mysql":
+        raise ValueError(f"Async streams need a mysql:// DATABASE_URL, not {backend.name}")
+    loop = asyncio.get_running_loop()
+    async with _pool_lock(loop):
+        pool = _pools.get(loop)
+        if pool is None or pool.closed:
+            pool = _pools[loop] = await aiomysql.create_pool(
+                host=backend.host,
+                port=backend.port or 3306,
+                user=backend.user,
+                password=backend.password,
+                db=backend.database,
+                minsize=minsize,
+                maxsize=maxsize,
+                autocommit=True,
+            )
+    return pool
+
+
+async def close_pool():
+    """
+    Closes the running event loop's pool and waits for its connections
+    to be released.
+    """
+    loop = asyncio.get_running_loop()
+    async with _pool_lock(loop):
+        pool = _pools.pop(loop, None)
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+
+async def stream_batches(query, params=(), fetch_size=seed.STREAM_FETCH_SIZE):
+    """
+    An async generator that runs a query on a pooled connection and
+    yields the result fetch_size rows at a time.
+
+    If the consumer stops early or is cancelled, the connection is closed
+    instead of reading the rest of the result set, and the pool opens a
+    new one when it is needed.
+
+    Args:
+        query: The SELECT statement to run.
+        params: The query parameters.
+        fetch_size: The number of rows fetched per round trip.
+
+    Yields:
+        A list of up to fetch_size row tuples.
+    """
+    pool = await get_pool()
+    conn = await pool.acquire()
+    exhausted = False
+    try:
+        cursor = await conn.cursor(aiomysql.SSCursor)
+        await cursor.execute(query, params)
+        while True:
+            batch = await cursor.fetchmany(fetch_size)
+            if not batch:
+                exhausted = True
+                break
+            yield list(batch)
+        await cursor.close()
+    finally:
+        if not exhausted:
+            conn.close()
+        pool.release(conn)
+
+
+async def async_stream_users(fetch_size=seed.STREAM_FETCH_SIZE):
+    """
+    An async generator that streams rows from the 'user_data' table
+    one by one.
+
+    Yields:
+        A tuple representing a single row from the database.
+    """
+    query, params = seed.build_select()
+    async with contextlib.aclosing(stream_batches(query, params, fetch_size)) as batches:
+        async for batch in batches:
+            for row in batch:
+                yield row
+
+
+async def async_stream_users_in_batches(batch_size, columns=None, where=None):
+    """
+    An async generator that streams users in batches. columns and where
+    are compiled into the query as in stream_users_in_batches.
+
+    Yields:
+        A list of up to batch_size row tuples.
+    """
+    query, params = seed.build_select(columns, where)
+    async with contextlib.aclosing(stream_batches(query, params, batch_size)) as batches:
+        async for batch in batches:
+            yield batch
+
+
+async def async_lazy_paginate(page_size):
+    """
+    An async generator that lazily loads pages of users. Each page is
+    a separate keyset query, so the connection goes back to the pool
+    between pages while the consumer works.
+
+    Yields:
+        A list of tuples representing a page of users.
+    """
+    last_id = None
+    pool = await get_pool()
+    while True:
+        where = [("user_id", ">", last_id)] if last_id is not None else None
+        query, params = seed.build_select(where=where)
+        query += " ORDER BY user_id LIMIT %s"
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params + (page_size,))
+                page = list(await cursor.fetchall())
+        if not page:
+            break
+        yield page
+        if len(page) < page_size:
+            break
+        last_id = page[-1][0]
+
+
+async def async_stream_user_ages(fetch_size=seed.STREAM_FETCH_SIZE):
+    """
+    An async generator that streams user ages.
+
+    Yields:
+        A single age (Decimal) from each row.
+    """
+    stream = stream_batches("SELECT age FROM user_data", (), fetch_size)
+    async with contextlib.aclosing(stream) as batches:
+        async for batch in batches:
+            for row in batch:
+                yield row[0]
+
+
+async def _demo():
+    # Several streams share the pool and the event loop
+    async def count(stream):
+        total = 0
+        async for _ in stream:
+            total += 1
+        return total
+
+    try:
+        users, ages = await asyncio.gather(
+            count(async_stream_users()), count(async_stream_user_ages()))
+        print(f"Streamed {users} users and {ages} ages concurrently")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
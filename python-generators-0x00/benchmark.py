@@ -0,0 +1,581 @@
+"""
+Benchmarks for the generator functions in this directory.
+
+The database is taken from DATABASE_URL (see seed.py), so the benchmarks
+can run against a local SQLite file, e.g. DATABASE_URL=sqlite:///bench.db.
+The suite is the exception: it empties and reseeds user_data, so it
+ignores DATABASE_URL and uses temporary SQLite files unless a database
+is named with --database, whose user_data table is then wiped.
+
+Usage:
+    python3 benchmark.py pagination [page_size] [max_pages]
+    python3 benchmark.py pushdown [batch_size]
+    python3 benchmark.py parallel [max_workers]
+    python3 benchmark.py prefetch [fetch_ms] [work_ms] [depth]
+    python3 benchmark.py rows [row_count]
+    python3 benchmark.py csv [size_mb] [workers]
+    python3 benchmark.py suite [sizes] [output.json] [--database URL]
+    python3 benchmark.py compare baseline.json current.json [tolerance]
+"""
+import contextlib
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+import fast_csv
+import parallel_scan
+import seed
+from prefetch import prefetch
+
+stream_users_module = __import__('0-stream_users')
+batch_module = __import__('1-batch_processing')
+lazy_paginate_module = __import__('2-lazy_paginate')
+stream_ages_module = __import__('4-stream_ages')
+
+# Table sizes seeded by the suite by default.
+SUITE_SIZES = (10_000, 1_000_000, 10_000_000)
+
+# Batch sizes the suite runs stream_users_in_batches with.
+SUITE_BATCH_SIZES = (100, 1000, 10_000)
+
+# Page size the suite runs the pagination generators with.
+SUITE_PAGE_SIZE = 5000
+
+
+def timed_pages(pages):
+    """
+    Drives a page generator and records how long each page took.
+
+    Args:
+        pages: A generator of pages.
+
+    Returns:
+        A list of per-page latencies in seconds.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in pages:
+        now = time.perf_counter()
+        latencies.append(now - start)
+        start = now
+    return latencies
+
+
+def benchmark_pagination(page_size=100, max_pages=None):
+    """
+    Compares LIMIT/OFFSET pagination against keyset pagination by walking
+    the whole table with both and reporting the latency of the first and
+    the deepest pages.
+
+    Args:
+        page_size: The number of rows per page.
+        max_pages: Stop after this many pages, or None for the whole table.
+
+    Returns:
+        A dict mapping each mode to its per-page latencies.
+    """
+    modes = {
+        "offset": lazy_paginate_module.lazy_paginate,
+        "keyset": lazy_paginate_module.lazy_paginate_keyset,
+    }
+    results = {}
+    for mode, paginate in modes.items():
+        pages = paginate(page_size)
+        if max_pages is not None:
+            pages = (page for _, page in zip(range(max_pages), pages))
+        latencies = timed_pages(pages)
+        results[mode] = latencies
+        if not latencies:
+            print(f"{mode:>6}: no pages fetched")
+            continue
+        tail = latencies[-10:]
+        print(f"{mode:>6}: {len(latencies)} pages, "
+              f"first page {latencies[0] * 1000:.2f} ms, "
+              f"deepest pages {sum(tail) / len(tail) * 1000:.2f} ms, "
+              f"total {sum(latencies):.2f}s")
+    return results
+
+
+def payload_bytes(row):
+    """
+    Approximates the number of bytes a row takes on the wire, as the
+    length of its text-protocol encoding.
+    """
+    return sum(len(str(value)) for value in row)
+
+
+def benchmark_pushdown(batch_size=1000, min_age=25):
+    """
+    Compares filtering users over min_age in Python after SELECT * with
+    pushing the filter and a (name, email) projection into the query.
+
+    Args:
+        batch_size: The number of rows per batch.
+        min_age: The age threshold of the filter.
+
+    Returns:
+        A dict mapping each mode to (rows, bytes, seconds).
+    """
+    results = {}
+
+    start = time.perf_counter()
+    rows = transferred = 0
+    for batch in batch_module.stream_users_in_batches(batch_size):
+        for row in batch:
+            transferred += payload_bytes(row)
+            if row[3] > min_age:
+                rows += 1
+    results["client"] = (rows, transferred, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rows = transferred = 0
+    for batch in batch_module.stream_users_in_batches(
+            batch_size, columns=("name", "email"), where=[("age", ">", min_age)]):
+        for row in batch:
+            transferred += payload_bytes(row)
+            rows += 1
+    results["pushdown"] = (rows, transferred, time.perf_counter() - start)
+
+    for mode, (rows, transferred, elapsed) in results.items():
+        print(f"{mode:>8}: {rows} matching rows, ~{transferred / 1024:,.0f} KiB "
+              f"transferred, {elapsed:.2f}s")
+    return results
+
+
+def benchmark_parallel_scan(max_workers=None, ordered=False):
+    """
+    Measures parallel_scan throughput for 1, 2, 4, ... workers up to
+    max_workers.
+
+    Args:
+        max_workers: The largest worker count, or None for the number of
+            CPUs.
+        ordered: Whether to run the scans in ordered mode.
+
+    Returns:
+        A dict mapping each worker count to rows per second.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({1 << i for i in range(max_workers.bit_length())} | {max_workers})
+    results = {}
+    for workers in counts:
+        if workers > max_workers:
+            continue
+        start = time.perf_counter()
+        rows = sum(len(batch) for batch in
+                   parallel_scan.parallel_scan_batches(workers, ordered))
+        elapsed = time.perf_counter() - start
+        results[workers] = rows / elapsed if elapsed > 0 else 0.0
+        speedup = results[workers] / results[counts[0]] if results[counts[0]] else 0.0
+        print(f"{workers:>3} workers: {rows} rows in {elapsed:.2f}s "
+              f"[{results[workers]:,.0f} rows/s, x{speedup:.2f}]")
+    return results
+
+
+def simulated_batches(count, fetch_seconds, batch_size=1000):
+    """
+    A batch generator that sleeps fetch_seconds per batch, standing in
+    for a database with that fetch latency.
+    """
+    for _ in range(count):
+        time.sleep(fetch_seconds)
+        yield [None] * batch_size
+
+
+def benchmark_prefetch(fetch_ms=20, work_ms=20, depth=2, batches=50, source=None):
+    """
+    Compares consuming batches directly with consuming them through
+    prefetch(), with work_ms of simulated processing per batch.
+
+    Args:
+        fetch_ms: The simulated fetch latency per batch, in ms.
+        work_ms: The simulated consumer work per batch, in ms.
+        depth: The prefetch depth.
+        batches: The number of simulated batches.
+        source: An optional function returning a real batch generator,
+            e.g. lambda: stream_users_in_batches(1000); fetch_ms and
+            batches are then ignored.
+
+    Returns:
+        A dict mapping each mode to its wall time in seconds.
+    """
+    if source is None:
+        source = lambda: simulated_batches(batches, fetch_ms / 1000)
+    results = {}
+    for mode, wrap in (("direct", iter), ("prefetch", lambda it: prefetch(it, depth))):
+        start = time.perf_counter()
+        count = 0
+        for _ in wrap(source()):
+            time.sleep(work_ms / 1000)
+            count += 1
+        results[mode] = time.perf_counter() - start
+        print(f"{mode:>8}: {count} batches in {results[mode]:.2f}s")
+    if results["prefetch"]:
+        print(f"overlap gain: x{results['direct'] / results['prefetch']:.2f}")
+    return results
+
+
+def synthetic_rows(count):
+    """
+    Generates user_data-shaped tuples, as the driver would return them.
+    """
+    for i in range(count):
+        yield (str(uuid.uuid4()), f"User Name {i}", f"user{i}@example.com",
+               Decimal(i % 10000).scaleb(-2))
+
+
+def benchmark_row_memory(count=100_000):
+    """
+    Compares the memory held by count rows as tuples and as
+    seed.CompactUser objects, measured with tracemalloc.
+
+    Args:
+        count: The number of rows.
+
+    Returns:
+        A dict mapping each representation to bytes per row.
+    """
+    results = {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        rows = list(synthetic_rows(count))
+        results["tuple"] = (tracemalloc.get_traced_memory()[0] - baseline) / count
+
+        compact = [seed.CompactUser.from_row(row) for row in rows]
+        del rows
+        gc.collect()
+        results["compact"] = (tracemalloc.get_traced_memory()[0] - baseline) / count
+        del compact
+    finally:
+        tracemalloc.stop()
+    for mode, per_row in results.items():
+        print(f"{mode:>8}: {per_row:.0f} bytes/row")
+    print(f"saving: {1 - results['compact'] / results['tuple']:.0%}")
+    return results
+
+
+def write_synthetic_csv(path, size_mb):
+    """
+    Writes a userdata.csv-shaped file of about size_mb MiB.
+    """
+    target = size_mb * 1024 * 1024
+    with open(path, "w", newline="") as file:
+        file.write("name,email,age\n")
+        written = i = 0
+        while written < target:
+            lines = "".join(
+                f"User Name {n},user{n}@example.com,{n % 120}\n" for n in range(i, i + 10000))
+            file.write(lines)
+            written += len(lines)
+            i += 10000
+
+
+def _count_range(args):
+    path, start, end = args
+    return sum(1 for _ in fast_csv.iter_range_rows(path, start, end))
+
+
+def benchmark_csv(size_mb=100, workers=None, path=None):
+    """
+    Compares parsing a synthetic CSV file with csv.reader, with the
+    memory-mapped fast_csv reader, and with fast_csv over line-aligned
+    ranges in a process pool. For the 5 GB case pass size_mb=5120.
+
+    Args:
+        size_mb: The size of the synthetic file in MiB.
+        workers: The number of processes for the parallel run, or None
+            for the number of CPUs.
+        path: An existing CSV file to parse instead of a synthetic one.
+
+    Returns:
+        A dict mapping each reader to rows per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        if path is None:
+            path = os.path.join(directory, "synthetic.csv")
+            write_synthetic_csv(path, size_mb)
+        size = os.path.getsize(path) / (1024 * 1024)
+
+        def run(name, count_rows):
+            start = time.perf_counter()
+            rows = count_rows()
+            elapsed = time.perf_counter() - start
+            results[name] = rows / elapsed if elapsed > 0 else 0.0
+            print(f"{name:>14}: {rows} rows in {elapsed:.2f}s "
+                  f"[{results[name]:,.0f} rows/s, {size / elapsed:,.1f} MiB/s]")
+
+        def csv_reader():
+            with open(path, newline="") as file:
+                reader = csv.reader(file)
+                next(reader, None)
+                return sum(1 for _ in reader)
+
+        def parallel():
+            ranges = [(path, start, end) for start, end in fast_csv.split_ranges(path, workers)]
+            with multiprocessing.Pool(workers) as pool:
+                return sum(pool.map(_count_range, ranges))
+
+        results = {}
+        run("csv.reader", csv_reader)
+        run("fast_csv", lambda: sum(1 for _ in fast_csv.iter_rows(path)))
+        run(f"fast_csv x{workers}", parallel)
+    return results
+
+
+def synthetic_csv_rows(count):
+    """
+    Generates (name, email, age) rows, as read from userdata.csv.
+    """
+    for i in range(count):
+        yield (f"User Name {i}", f"user{i}@example.com", str(Decimal(i % 12000).scaleb(-2)))
+
+
+def prepare_suite_database(size, url):
+    """
+    Empties user_data in the database at url and seeds it with size
+    synthetic users.
+    """
+    seed.configure(url)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        conn = seed.connect_to_prodev()
+        try:
+            seed.create_table(conn)
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM {seed.TABLE_NAME}")
+            conn.commit()
+            cursor.close()
+            seed.bulk_insert_rows(conn, synthetic_csv_rows(size), chunk_size=10_000)
+        finally:
+            conn.close()
+
+
+def suite_targets(batch_sizes=SUITE_BATCH_SIZES, page_size=SUITE_PAGE_SIZE):
+    """
+    Returns the (function, params) pairs measured by the suite.
+    """
+    targets = [("stream_users", {})]
+    targets += [("stream_users_in_batches", {"batch_size": size}) for size in batch_sizes]
+    targets += [
+        ("lazy_paginate", {"page_size": page_size}),
+        ("lazy_paginate_keyset", {"page_size": page_size}),
+        ("calculate_average_age", {}),
+        ("calculate_average_age_streaming", {}),
+    ]
+    return targets
+
+
+def _suite_items(name, params):
+    """
+    Returns an iterable for a suite target and a function giving the
+    number of rows in each of its items.
+    """
+    if name == "stream_users":
+        return stream_users_module.stream_users(), lambda row: 1
+    if name == "stream_users_in_batches":
+        return batch_module.stream_users_in_batches(params["batch_size"]), len
+    if name == "lazy_paginate":
+        return lazy_paginate_module.lazy_paginate(params["page_size"]), len
+    if name == "lazy_paginate_keyset":
+        return lazy_paginate_module.lazy_paginate_keyset(params["page_size"]), len
+    if name == "calculate_average_age":
+        return (stream_ages_module.aggregate_ages()["count"] for _ in range(1)), int
+    if name == "calculate_average_age_streaming":
+        accumulator = stream_ages_module.AgeAccumulator()
+
+        def ages():
+            for age in stream_ages_module.stream_user_ages():
+                accumulator.add(age)
+                yield age
+        return ages(), lambda age: 1
+    raise ValueError(f"Unknown suite target: {name!r}")
+
+
+def _measure(url, name, params, trace_memory):
+    """
+    Runs one suite target in the current (fresh) process and returns its
+    rows/s, time to first row and peak memory.
+    """
+    seed.configure(url)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            first = None
+            rows = 0
+            items, rows_in = _suite_items(name, params)
+            for item in items:
+                if first is None:
+                    first = time.perf_counter() - start
+                rows += rows_in(item)
+            elapsed = time.perf_counter() - start
+            traced = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            tracemalloc.stop()
+    return {
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_s": rows / elapsed if elapsed > 0 else 0.0,
+        "time_to_first_row_s": first,
+        "peak_rss_mb": seed.peak_memory_mb(),
+        "peak_traced_mb": traced / (1024 * 1024) if traced is not None else None,
+    }
+
+
+def _measure_in_subprocess(url, name, params, trace_memory):
+    # A fresh spawned process per run, so peak RSS belongs to that run only
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure, (url, name, params, trace_memory))
+
+
+def run_suite(sizes=SUITE_SIZES, output="benchmark_results.json", url=None,
+              batch_sizes=SUITE_BATCH_SIZES, page_size=SUITE_PAGE_SIZE, trace_memory=True):
+    """
+    Seeds user_data with synthetic users at each size and measures
+    rows/s, time to first row, peak RSS and (in a separate run, since
+    tracing slows the code down) peak tracemalloc memory of the streaming
+    functions. Each run happens in a fresh process. The results are
+    written to output as JSON for compare_results().
+
+    Args:
+        sizes: The table sizes to seed.
+        output: The path of the JSON results file.
+        url: The database to use; by default a temporary SQLite file per
+            size. The user_data table at url is emptied and reseeded.
+        batch_sizes: The batch sizes for stream_users_in_batches.
+        page_size: The page size for the pagination generators.
+        trace_memory: Whether to do the tracemalloc runs.
+
+    Returns:
+        The list of result dicts.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            size_url = url or f"sqlite:///{os.path.join(directory, f'suite_{size}.db')}"
+            start = time.perf_counter()
+            prepare_suite_database(size, size_url)
+            print(f"Seeded {size} rows in {time.perf_counter() - start:.1f}s")
+            for name, params in suite_targets(batch_sizes, page_size):
+                result = _measure_in_subprocess(size_url, name, params, False)
+                if trace_memory:
+                    traced = _measure_in_subprocess(size_url, name, params, True)
+                    result["peak_traced_mb"] = traced["peak_traced_mb"]
+                result.update({"size": size, "function": name, "params": params})
+                results.append(result)
+                ttfr = result["time_to_first_row_s"]
+                print(f"{size:>10} {name} {params or ''}: "
+                      f"{result['rows_per_s']:,.0f} rows/s, "
+                      f"ttfr {ttfr * 1000 if ttfr is not None else float('nan'):.1f} ms"
+                      + (f", peak RSS {result['peak_rss_mb']:.1f} MiB"
+                         if result["peak_rss_mb"] is not None else "")
+                      + (f", peak traced {result['peak_traced_mb']:.2f} MiB"
+                         if result["peak_traced_mb"] is not None else ""))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": seed.get_backend(url).name if url else "sqlite",
+        },
+        "results": results,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+    return results
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    Compares two suite result files and reports the runs whose rows/s
+    dropped, or whose time to first row or peak memory grew, by more
+    than tolerance.
+
+    Args:
+        baseline: The path of the reference results.
+        current: The path of the new results.
+        tolerance: The allowed relative change.
+
+    Returns:
+        A list of (size, function, params, metric, old, new) regressions.
+    """
+    def load(path):
+        with open(path) as file:
+            return {(r["size"], r["function"], json.dumps(r["params"], sort_keys=True)): r
+                    for r in json.load(file)["results"]}
+
+    old_results, new_results = load(baseline), load(current)
+    higher_is_better = {"rows_per_s": True, "time_to_first_row_s": False,
+                        "peak_rss_mb": False, "peak_traced_mb": False}
+    regressions = []
+    for key, new in new_results.items():
+        old = old_results.get(key)
+        if old is None:
+            continue
+        for metric, higher in higher_is_better.items():
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (higher and change < -tolerance) or (not higher and change > tolerance):
+                regressions.append(key + (metric, before, after))
+                print(f"REGRESSION {key[0]} {key[1]} {key[2]}: {metric} {before:.4g} -> {after:.4g}")
+    if not regressions:
+        print("No regressions.")
+    return regressions
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "pagination":
+        size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        benchmark_pagination(size, limit)
+    elif command == "pushdown":
+        benchmark_pushdown(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    elif command == "parallel":
+        benchmark_parallel_scan(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif command == "prefetch":
+        args = [int(arg) for arg in sys.argv[2:5]]
+        benchmark_prefetch(*args)
+    elif command == "rows":
+        benchmark_row_memory(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    elif command == "csv":
+        args = [int(arg) for arg in sys.argv[2:4]]
+        benchmark_csv(*args)
+    elif command == "suite":
+        args = sys.argv[2:]
+        url = None
+        if "--database" in args:
+            # Opting in to wipe and reseed a real database's user_data
+            position = args.index("--database")
+            if position + 1 >= len(args):
+                print("--database needs a database URL")
+                sys.exit(1)
+            url = args[position + 1]
+            del args[position:position + 2]
+        sizes = SUITE_SIZES
+        if args:
+            sizes = [int(size) for size in args[0].split(",")]
+        output = args[1] if len(args) > 1 else "benchmark_results.json"
+        run_suite(sizes, output, url)
+    elif command == "compare" and len(sys.argv) > 3:
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+        sys.exit(1 if compare_results(sys.argv[2], sys.argv[3], tolerance) else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
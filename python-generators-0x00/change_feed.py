@@ -0,0 +1,137 @@
+"""
+Incremental change streaming from the user_data table.
+
+incremental_insert_data gives every row it inserts or modifies the next
+change sequence number (the seq column of the seed state table). A
+change feed reads the rows whose seq is above a consumer's watermark in
+seq order, and moves the watermark forward in the database as the
+consumer works through them, so each run only reads the rows changed
+since the previous one.
+
+Only rows written by incremental_insert_data have sequence numbers;
+rows loaded by insert_data or bulk_insert_data never appear in the feed.
+"""
+import seed
+
+# Table holding the watermark (last consumed seq) of every consumer.
+WATERMARK_TABLE = "user_data_watermarks"
+
+CHANGES_QUERY = (
+    f"SELECT u.user_id, u.name, u.email, u.age, s.seq FROM {seed.TABLE_NAME} u "
+    f"JOIN {seed.SEED_STATE_TABLE} s ON s.user_id = u.user_id "
+    f"WHERE s.seq > %s ORDER BY s.seq LIMIT %s"
+)
+
+
+def create_watermark_table(connection):
+    """
+    Creates the table of consumer watermarks if it does not exist.
+
+    Args:
+        connection: The database connection object.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            consumer VARCHAR(64) PRIMARY KEY,
+            seq BIGINT NOT NULL
+        )
+        """)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def load_watermark(connection, consumer):
+    """
+    Returns the last seq consumed by consumer, or -1 if it has never run.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT seq FROM {WATERMARK_TABLE} WHERE consumer = %s", (consumer,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else -1
+
+
+def save_watermark(connection, consumer, seq):
+    """
+    Stores seq as the last seq consumed by consumer, and commits.
+    """
+    query = seed.get_current_backend().upsert_query(WATERMARK_TABLE, ("consumer", "seq"),
+                                                    ("consumer",))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, (consumer, seq))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def stream_changed_batches(consumer, batch_size=seed.STREAM_FETCH_SIZE, since=None):
+    """
+    A generator that streams the users inserted or modified since the
+    consumer's last run, in batches, in the order they were changed.
+
+    A batch's watermark is saved when the next batch is requested, i.e.
+    after the caller has processed it. If the caller stops early or
+    fails, the unsaved batch is delivered again on the next run (at
+    least once delivery). A row changed again while the feed runs is
+    delivered again later, with its new values.
+
+    Args:
+        consumer: The name under which the watermark is stored.
+        batch_size: The number of rows per batch.
+        since: A seq to start after instead of the stored watermark;
+            -1 replays every change.
+
+    Yields:
+        A list of (user_id, name, email, age) tuples.
+
+    Raises:
+        One of seed.DB_ERRORS or seed.PoolTimeout if the database fails.
+    """
+    conn = seed.open_connection()
+    try:
+        seed.create_seed_state_table(conn)
+        create_watermark_table(conn)
+        watermark = load_watermark(conn, consumer) if since is None else since
+        while True:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(CHANGES_QUERY, (watermark, batch_size))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+            if not rows:
+                return
+            yield [row[:4] for row in rows]
+            watermark = rows[-1][4]
+            save_watermark(conn, consumer, watermark)
+            if len(rows) < batch_size:
+                return
+    finally:
+        conn.close()
+
+
+def stream_changes(consumer, batch_size=seed.STREAM_FETCH_SIZE, since=None):
+    """
+    A generator that streams the users changed since the consumer's last
+    run one by one. See stream_changed_batches() for the arguments and
+    delivery guarantees.
+
+    Yields:
+        A tuple representing a single changed row.
+    """
+    for batch in stream_changed_batches(consumer, batch_size, since):
+        yield from batch
+
+
+if __name__ == "__main__":
+    total = 0
+    for i, batch in enumerate(stream_changed_batches("demo", 100)):
+        total += len(batch)
+        print(f"Batch {i+1}: {len(batch)} changed rows, first user {batch[0][0]}")
+    print(f"{total} rows changed since the last run")
@@ -0,0 +1,315 @@
+"""
+Exports the user_data table to JSONL, CSV or Parquet files.
+
+Rows are streamed with seed.stream_batches on a background thread (see
+prefetch.py) while the main thread encodes and writes the previous
+batches, so memory stays at a few batches however large the table is.
+Each batch is written as one row group. Text formats can be gzip
+compressed, and the output can be split into several files of about
+--max-bytes each.
+
+Database errors abort the export: the files written so far are removed
+and the command exits with status 1, so a partial dump is never left
+behind looking complete.
+
+Usage:
+    python3 export_users.py users.jsonl.gz
+    python3 export_users.py users.csv --format csv --no-compress
+    python3 export_users.py users.parquet --format parquet --max-bytes 100000000
+"""
+import abc
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+import seed
+from prefetch import prefetch
+from seed import USER_COLUMNS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for --format parquet
+    pyarrow = None
+
+# Rows per batch, i.e. per row group.
+EXPORT_BATCH_SIZE = 10_000
+
+FORMATS = ("jsonl", "csv", "parquet")
+
+
+class ExportWriter(abc.ABC):
+    """
+    Writes batches of user rows to one or more files, starting a new
+    file once the current one reaches max_bytes (checked after each row
+    group, so files may overshoot by up to one row group). Subclasses implement
+    _open, _write and _close for their format.
+    """
+    extension = ""
+
+    def __init__(self, path, compress=True, max_bytes=None):
+        """
+        Args:
+            path: The output path. When splitting, files are named
+                <stem>-00000<extension>, <stem>-00001<extension>, ...
+            compress: Whether to gzip the output (text formats only).
+            max_bytes: The size at which to start a new file, or None to
+                write a single file.
+        """
+        self.path = path
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.files = []
+        self.rows = 0
+        self._raw = None
+
+    def _part_path(self):
+        if not self.max_bytes:
+            return self.path
+        stem = self.path
+        for suffix in (".gz", self.extension):
+            if stem.endswith(suffix):
+                stem = stem[:-len(suffix)]
+        suffix = self.extension + (".gz" if self.compress and self.extension != ".parquet" else "")
+        return f"{stem}-{len(self.files):05d}{suffix}"
+
+    def _open_part(self):
+        path = self._part_path()
+        self._raw = open(path, "wb")
+        self.files.append(path)
+        self._open(self._raw)
+
+    def write_batch(self, batch):
+        """
+        Writes one batch of (user_id, name, email, age) rows as a row group.
+        """
+        if self._raw is None:
+            self._open_part()
+        self._write(batch)
+        self.rows += len(batch)
+        if self.max_bytes and self._raw.tell() >= self.max_bytes:
+            self._close_part()
+
+    def _close_part(self):
+        self._close()
+        self._raw.close()
+        self._raw = None
+
+    def close(self):
+        """
+        Finishes the current file. An export of an empty table still
+        produces one (empty) file.
+        """
+        if self._raw is None and not self.files:
+            self._open_part()
+        if self._raw is not None:
+            self._close_part()
+
+    @abc.abstractmethod
+    def _open(self, raw):
+        """
+        Starts writing a new file to the binary file object raw.
+        """
+
+    @abc.abstractmethod
+    def _write(self, batch):
+        """
+        Writes one batch of rows to the current file.
+        """
+
+    @abc.abstractmethod
+    def _close(self):
+        """
+        Finishes the current file; raw is closed by the caller.
+        """
+
+
+class TextExportWriter(ExportWriter):
+    """
+    Base class of the text formats: encodes each batch to one string and
+    writes it through an optional gzip layer. Subclasses implement
+    _encode.
+    """
+
+    def _open(self, raw):
+        self._binary = gzip.GzipFile(fileobj=raw, mode="wb") if self.compress else raw
+        self._text = io.TextIOWrapper(self._binary, encoding="utf-8", newline="")
+        self._start()
+
+    def _start(self):
+        pass
+
+    @abc.abstractmethod
+    def _encode(self, batch):
+        """
+        Returns a batch of rows as text.
+        """
+
+    def _write(self, batch):
+        self._text.write(self._encode(batch))
+        # Push the row group through gzip so the file size is up to date
+        self._text.flush()
+
+    def _close(self):
+        self._text.flush()
+        self._text.detach()
+        if self._binary is not self._raw:
+            self._binary.close()
+
+
+class JSONLWriter(TextExportWriter):
+    """
+    One JSON object per line, with the age as a number.
+    """
+    extension = ".jsonl"
+
+    def _encode(self, batch):
+        return "".join(
+            json.dumps({"user_id": user_id, "name": name, "email": email, "age": float(age)}) + "\n"
+            for user_id, name, email, age in batch)
+
+
+class CSVWriter(TextExportWriter):
+    """
+    CSV with a header row in every file.
+    """
+    extension = ".csv"
+
+    def _start(self):
+        self._text.write(",".join(USER_COLUMNS) + "\r\n")
+
+    def _encode(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        return buffer.getvalue()
+
+
+class ParquetWriter(ExportWriter):
+    """
+    Parquet with one row group per batch; age is stored as decimal(5, 2).
+    Parquet compresses its column chunks itself (snappy).
+    """
+    extension = ".parquet"
+
+    def __init__(self, path, compress=True, max_bytes=None):
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for --format parquet")
+        super().__init__(path, compress, max_bytes)
+        self.schema = pyarrow.schema([
+            ("user_id", pyarrow.string()),
+            ("name", pyarrow.string()),
+            ("email", pyarrow.string()),
+            ("age", pyarrow.decimal128(5, 2)),
+        ])
+
+    def _open(self, raw):
+        self._writer = pyarrow.parquet.ParquetWriter(
+            raw, self.schema, compression="snappy" if self.compress else "none")
+
+    def _write(self, batch):
+        columns = list(zip(*batch))
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(batch))
+
+    def _close(self):
+        self._writer.close()
+
+
+WRITERS = {"jsonl": JSONLWriter, "csv": CSVWriter, "parquet": ParquetWriter}
+
+
+def stream_all_users(batch_size):
+    """
+    A generator that streams the whole user_data table in batches. Unlike
+    stream_users_in_batches, connection and query errors are raised, not
+    printed, so a failed export cannot pass for a complete one.
+
+    Yields:
+        A list of up to batch_size (user_id, name, email, age) tuples.
+
+    Raises:
+        seed.PoolTimeout or one of seed.DB_ERRORS if the database fails.
+    """
+    connection = seed.open_connection()
+    try:
+        query, params = seed.build_select()
+        # Closing the connection discards any unread rows
+        yield from seed.stream_batches(connection, query, params, batch_size, drain=False)
+    finally:
+        connection.close()
+
+
+def export_users(path, file_format="jsonl", compress=True, max_bytes=None,
+                 batch_size=EXPORT_BATCH_SIZE, prefetch_depth=2):
+    """
+    Exports every user to path in the given format.
+
+    Args:
+        path: The output path (or path template when splitting).
+        file_format: One of FORMATS.
+        compress: Whether to compress the output.
+        max_bytes: The size at which to start a new file, or None.
+        batch_size: Rows per batch and row group.
+        prefetch_depth: Batches fetched ahead of the writer.
+
+    Returns:
+        The list of files written.
+
+    Raises:
+        seed.PoolTimeout or one of seed.DB_ERRORS if the database fails,
+        OSError if writing fails. The files written so far are removed.
+    """
+    if file_format not in WRITERS:
+        raise ValueError(f"Unsupported format: {file_format!r}")
+    writer = WRITERS[file_format](path, compress, max_bytes)
+    start = time.perf_counter()
+    try:
+        try:
+            for batch in prefetch(stream_all_users(batch_size), prefetch_depth):
+                writer.write_batch(batch)
+        finally:
+            writer.close()
+    except BaseException:
+        for file in writer.files:
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+        raise
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(file) for file in writer.files)
+    print(f"Exported {writer.rows} rows to {len(writer.files)} file(s), "
+          f"{size / (1024 * 1024):.1f} MiB in {elapsed:.2f}s")
+    return writer.files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the user_data table.")
+    parser.add_argument("path", help="output file, or name template when splitting")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--no-compress", action="store_true", help="do not compress the output")
+    parser.add_argument("--max-bytes", type=int, default=None,
+                        help="start a new file once a file reaches this size")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE,
+                        help="rows per batch and row group")
+    args = parser.parse_args(argv)
+    try:
+        export_users(args.path, args.format, not args.no_compress, args.max_bytes, args.batch_size)
+    except ImportError as err:
+        print(f"Error: {err}")
+        return 1
+    except (seed.PoolTimeout, OSError) + seed.DB_ERRORS as err:
+        print(f"Export failed, partial output removed: {err}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+A memory-mapped reader for large user CSV exports.
+
+The file is memory-mapped instead of read through a buffered text stream,
+and split into byte ranges that start and end on line boundaries, so each
+range can be parsed independently (e.g. by several worker processes).
+Within a range the mapping is decoded in large blocks and split on
+newlines and commas, which avoids csv.reader's per-field
+state machine. Lines containing quotes fall back to the csv module.
+Quoted fields spanning several lines are not supported.
+"""
+import csv
+import mmap
+import os
+from itertools import repeat
+
+# Bytes decoded and split at a time within a range.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def _map(file):
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def split_ranges(path, parts, skip_header=True):
+    """
+    Splits a CSV file into about equally sized, line-aligned byte ranges.
+
+    Args:
+        path: The path to the CSV file.
+        parts: The number of ranges wanted; fewer are returned if the
+            file has fewer lines.
+        skip_header: Whether the first line is a header to leave out.
+
+    Returns:
+        A list of (start, end) byte offsets; end is exclusive.
+    """
+    if parts < 1:
+        raise ValueError("parts must be at least 1")
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as file, _map(file) as mapped:
+        start = 0
+        if skip_header:
+            newline = mapped.find(b"\n")
+            start = size if newline == -1 else newline + 1
+        bounds = [start]
+        for i in range(1, parts):
+            target = start + (size - start) * i // parts
+            if target <= bounds[-1]:
+                continue
+            # The line containing target stays in the previous range
+            newline = mapped.find(b"\n", target)
+            if newline == -1 or newline + 1 >= size:
+                break
+            bounds.append(newline + 1)
+        bounds.append(size)
+    return [(low, high) for low, high in zip(bounds[:-1], bounds[1:]) if low < high]
+
+
+def parse_line(line):
+    """
+    Splits one CSV line into a tuple of fields.
+    """
+    if '"' in line:
+        return tuple(next(csv.reader([line])))
+    return tuple(line.split(","))
+
+
+def iter_range_rows(path, start, end):
+    """
+    A generator that parses the CSV lines in the byte range [start, end)
+    of a file. start must be the beginning of a line, as returned by
+    split_ranges().
+
+    Args:
+        path: The path to the CSV file.
+        start: The first byte of the range.
+        end: The byte after the range.
+
+    Yields:
+        A tuple of str fields for each non-empty line.
+    """
+    with open(path, "rb") as file, _map(file) as mapped:
+        position = start
+        while position < end:
+            stop = min(position + BLOCK_SIZE, end)
+            if stop < end:
+                # Cut the block after its last complete line
+                newline = mapped.rfind(b"\n", position, stop)
+                if newline == -1:
+                    newline = mapped.find(b"\n", stop, end)
+                stop = end if newline == -1 else newline + 1
+            text = mapped[position:stop].decode()
+            lines = filter(None, text.split("\n"))
+            if '"' not in text and "\r" not in text:
+                # Fast path: plain comma-separated lines
+                yield from map(tuple, map(str.split, lines, repeat(",")))
+            else:
+                for line in lines:
+                    if line.endswith("\r"):
+                        line = line[:-1]
+                    if line:
+                        yield parse_line(line)
+            position = stop
+
+
+def iter_rows(path, skip_header=True):
+    """
+    A generator that parses a whole CSV file with the memory-mapped reader.
+
+    Args:
+        path: The path to the CSV file.
+        skip_header: Whether to leave out the first line.
+
+    Yields:
+        A tuple of str fields for each data row.
+    """
+    for start, end in split_ranges(path, 1, skip_header):
+        yield from iter_range_rows(path, start, end)
@@ -0,0 +1,191 @@
+"""
+Parallel, range-partitioned scan of the user_data table.
+
+The user_id key space is split into ranges, each range is read on its
+own connection by a worker process, and the batches are merged back into
+a single stream, either in user_id order or in arrival order.
+"""
+import multiprocessing
+import os
+import queue
+
+import seed
+
+# user_id values are lowercase hex UUIDs, so splitting the space of their
+# first 8 hex digits evenly gives evenly sized key ranges.
+KEY_SPACE = 16 ** 8
+
+# Batches each worker may have waiting in its queue before it blocks.
+QUEUE_DEPTH = 4
+
+# Seconds to wait on a queue before checking that the workers are alive.
+POLL_INTERVAL = 1.0
+
+_DONE = "done"
+_BATCH = "batch"
+_ERROR = "error"
+
+
+def key_ranges(partitions):
+    """
+    Splits the user_id key space into contiguous ranges.
+
+    Args:
+        partitions: The number of ranges.
+
+    Returns:
+        A list of (low, high) tuples; low is inclusive, high exclusive,
+        and None means unbounded.
+    """
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1")
+    bounds = [format(KEY_SPACE * i // partitions, "08x") for i in range(1, partitions)]
+    bounds = [None] + bounds + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def range_query(low, high, columns=None, where=None, ordered=True):
+    """
+    Builds the SELECT statement for one key range.
+
+    Args:
+        low: The inclusive lower user_id bound, or None.
+        high: The exclusive upper user_id bound, or None.
+        columns: The columns to select, or None for all of them.
+        where: Extra (column, operator, value) conditions, or None.
+        ordered: Whether to return the rows in user_id order.
+
+    Returns:
+        A (query, params) tuple.
+    """
+    conditions = list(where or ())
+    if low is not None:
+        conditions.append(("user_id", ">=", low))
+    if high is not None:
+        conditions.append(("user_id", "<", high))
+    query, params = seed.build_select(columns, conditions)
+    if ordered:
+        query += " ORDER BY user_id"
+    return query, params
+
+
+def _scan_worker(url, partition, query, params, batch_size, out):
+    """
+    Worker process body: streams one key range into a queue, followed by
+    a done marker, or an error message if the scan fails.
+
+    The backend is configured from url, as a spawned or forkserver child
+    does not inherit the parent's seed.configure(), and the range is read
+    over a connection of its own rather than from an inherited pool.
+    """
+    conn = None
+    try:
+        current = (seed.backend if url == seed.backend_url and seed.backend is not None
+                   else seed.configure(url))
+        conn = current.connect()
+        for batch in seed.stream_batches(conn, query, params, fetch_size=batch_size, drain=False):
+            out.put((partition, _BATCH, batch))
+        out.put((partition, _DONE, None))
+    except Exception as err:
+        out.put((partition, _ERROR, repr(err)))
+    finally:
+        if conn:
+            conn.close()
+
+
+def _read_queue(out, workers, expected_done):
+    """
+    Yields batches from a queue until expected_done workers have finished.
+    Raises RuntimeError if a worker fails or dies without finishing.
+    """
+    done = 0
+    while done < expected_done:
+        try:
+            partition, kind, payload = out.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                raise RuntimeError("scan worker exited without finishing its range")
+            continue
+        if kind == _BATCH:
+            yield payload
+        elif kind == _DONE:
+            done += 1
+        else:
+            raise RuntimeError(f"scan of range {partition} failed: {payload}")
+
+
+def parallel_scan_batches(workers=None, ordered=False, batch_size=seed.STREAM_FETCH_SIZE,
+                          columns=None, where=None):
+    """
+    A generator that scans user_data with one process per key range.
+
+    In unordered mode batches are yielded as soon as any worker produces
+    them. In ordered mode the ranges are yielded one after the other,
+    each sorted by user_id, so the stream is globally ordered; later
+    ranges are read ahead up to QUEUE_DEPTH batches per worker. Memory
+    stays bounded either way, and closing the generator stops the workers.
+
+    Args:
+        workers: The number of worker processes (and key ranges), or
+            None for the number of CPUs.
+        ordered: Whether to yield rows in user_id order.
+        batch_size: The number of rows per batch.
+        columns: The columns to select, or None for all of them.
+        where: Extra (column, operator, value) conditions, or None.
+
+    Yields:
+        A list of row tuples.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Resolve the URL here, so the workers use the parent's backend
+    seed.get_current_backend()
+    url = seed.backend_url
+    context = multiprocessing.get_context()
+    ranges = key_ranges(workers)
+    if ordered:
+        queues = [context.Queue(QUEUE_DEPTH) for _ in ranges]
+    else:
+        shared = context.Queue(QUEUE_DEPTH * workers)
+        queues = [shared] * workers
+
+    processes = []
+    for partition, (low, high) in enumerate(ranges):
+        query, params = range_query(low, high, columns, where, ordered)
+        process = context.Process(
+            target=_scan_worker,
+            args=(url, partition, query, params, batch_size, queues[partition]),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    try:
+        if ordered:
+            for partition, out in enumerate(queues):
+                yield from _read_queue(out, [processes[partition]], 1)
+        else:
+            yield from _read_queue(queues[0], processes, workers)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def parallel_scan(workers=None, ordered=False, batch_size=seed.STREAM_FETCH_SIZE,
+                  columns=None, where=None):
+    """
+    A generator that yields the rows of parallel_scan_batches() one by
+    one. See parallel_scan_batches() for the arguments.
+
+    Yields:
+        A tuple representing a single row.
+    """
+    for batch in parallel_scan_batches(workers, ordered, batch_size, columns, where):
+        yield from batch
+
+
+if __name__ == "__main__":
+    for i, row in enumerate(parallel_scan(workers=4, ordered=True)):
+        print(f"Row {i+1}: {row}")
+        if i > 10: break
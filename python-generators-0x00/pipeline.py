@@ -0,0 +1,405 @@
+"""
+Composable streaming pipelines over the user generators.
+
+A pipeline is a source followed by map, filter, batch and unbatch
+stages and, optionally, a sink:
+
+    pipeline = (Pipeline.from_user_batches(1000)
+                .unbatch()
+                .filter(lambda row: row[3] > 25)
+                .map(format_row, workers=4)
+                .batch(100)
+                .sink(write_rows))
+    pipeline.run()
+    pipeline.report()
+
+Every stage runs on its own thread and hands its output to the next
+stage through a bounded queue, so a slow stage makes the stages before
+it wait (backpressure) instead of letting items pile up in memory. A map
+or filter stage can fan out to a pool of threads, or of processes for
+CPU-bound functions (the function and items must then be picklable),
+while keeping items in order.
+
+Each stage records how long it waited for input and for room in its
+output queue, and how full its input queue was. The bottleneck is the
+stage that is busy most of the time: the stages before it wait on full
+queues and the stages after it wait on empty ones.
+"""
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+from seed import STREAM_FETCH_SIZE
+
+# Items each stage may have waiting in its output queue.
+QUEUE_SIZE = 8
+
+# Items submitted ahead per fan-out worker.
+FANOUT_DEPTH = 2
+
+# Seconds a stage blocks on a queue before checking whether the
+# pipeline has been stopped.
+POLL_INTERVAL = 0.1
+
+_END = object()
+
+
+class _Stopped(Exception):
+    """
+    Raised inside a stage when the pipeline is stopped.
+    """
+
+
+class Stage:
+    """
+    One step of a pipeline and its metrics.
+    """
+
+    def __init__(self, kind, name, function=None, size=None, workers=1, processes=False,
+                 queue_size=QUEUE_SIZE):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.kind = kind
+        self.name = name
+        self.function = function
+        self.size = size
+        self.workers = workers
+        self.processes = processes
+        self.queue_size = queue_size
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.items_in = 0
+        self.items_out = 0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.elapsed = 0.0
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+
+    def metrics(self):
+        """
+        Returns:
+            A dict with the stage's item counts, throughput (output items
+            per second), busy fraction (the share of its time not spent
+            waiting on a queue), seconds spent waiting for input and for
+            output room, and the mean and max depth of its input queue.
+        """
+        elapsed = self.elapsed
+        busy = elapsed - self.wait_in - self.wait_out
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "throughput": self.items_out / elapsed if elapsed > 0 else 0.0,
+            "busy": max(busy, 0.0) / elapsed if elapsed > 0 else 0.0,
+            "wait_in": self.wait_in,
+            "wait_out": self.wait_out,
+            "queue_mean": self.queue_total / self.queue_samples if self.queue_samples else 0.0,
+            "queue_max": self.queue_max,
+        }
+
+    def process(self, items):
+        """
+        A generator applying the stage to its input items.
+        """
+        if self.kind == "source":
+            yield from self.function()
+        elif self.kind == "batch":
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= self.size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        elif self.kind == "unbatch":
+            for item in items:
+                yield from item
+        elif self.workers > 1 or self.processes:
+            yield from self._fan_out(items)
+        else:
+            function = self.function
+            for item in items:
+                yield from self._outputs(item, function(item))
+
+    def _fan_out(self, items):
+        executor_class = (concurrent.futures.ProcessPoolExecutor if self.processes
+                          else concurrent.futures.ThreadPoolExecutor)
+        executor = executor_class(max_workers=self.workers)
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append((item, executor.submit(self.function, item)))
+                if len(pending) >= self.workers * FANOUT_DEPTH:
+                    item, future = pending.popleft()
+                    yield from self._outputs(item, future.result())
+            while pending:
+                item, future = pending.popleft()
+                yield from self._outputs(item, future.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _outputs(self, item, result):
+        """
+        Returns what a map, filter or sink stage passes on for an item,
+        given the result of its function. A sink's items are only
+        counted, not sent.
+        """
+        if self.kind == "map":
+            return (result,)
+        if self.kind == "filter" and not result:
+            return ()
+        return (item,)
+
+
+class Pipeline:
+    """
+    A chain of stages, built by calling the stage methods in order. Each
+    method returns the pipeline, so calls can be chained.
+    """
+
+    def __init__(self, source, name="source", queue_size=QUEUE_SIZE):
+        """
+        Args:
+            source: An iterable, or a function returning one. Pass a
+                function (e.g. lambda: stream_users()) to be able to run
+                the pipeline more than once.
+            name: The source stage's name in the metrics.
+            queue_size: The bound of the source's output queue.
+        """
+        function = source if callable(source) else (lambda: source)
+        self.stages = [Stage("source", name, function, queue_size=queue_size)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_users(cls, fetch_size=STREAM_FETCH_SIZE, queue_size=QUEUE_SIZE):
+        """
+        A pipeline whose source is stream_users(), one row per item.
+        """
+        stream_users = __import__('0-stream_users').stream_users
+        return cls(lambda: stream_users(fetch_size), "stream_users", queue_size)
+
+    @classmethod
+    def from_user_batches(cls, batch_size, columns=None, where=None, queue_size=QUEUE_SIZE):
+        """
+        A pipeline whose source is stream_users_in_batches(), one list of
+        rows per item.
+        """
+        stream_users_in_batches = __import__('1-batch_processing').stream_users_in_batches
+        return cls(lambda: stream_users_in_batches(batch_size, columns, where),
+                   "stream_users_in_batches", queue_size)
+
+    def _add(self, stage):
+        if self.stages[-1].kind == "sink":
+            raise ValueError("cannot add stages after a sink")
+        self.stages.append(stage)
+        return self
+
+    def map(self, function, workers=1, processes=False, name=None, queue_size=QUEUE_SIZE):
+        """
+        Adds a stage that replaces each item with function(item).
+
+        Args:
+            function: The function to apply.
+            workers: The number of threads (or processes) to run it on.
+            processes: Fan out to processes instead of threads.
+            name: The stage's name in the metrics.
+            queue_size: The bound of the stage's output queue.
+        """
+        return self._add(Stage("map", name or f"map({_name(function)})", function,
+                               workers=workers, processes=processes, queue_size=queue_size))
+
+    def filter(self, predicate, workers=1, processes=False, name=None, queue_size=QUEUE_SIZE):
+        """
+        Adds a stage that keeps the items for which predicate(item) is
+        true. The arguments are as for map().
+        """
+        return self._add(Stage("filter", name or f"filter({_name(predicate)})", predicate,
+                               workers=workers, processes=processes, queue_size=queue_size))
+
+    def batch(self, size, name=None, queue_size=QUEUE_SIZE):
+        """
+        Adds a stage that groups items into lists of size items (the
+        last one may be shorter).
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        return self._add(Stage("batch", name or f"batch({size})", size=size,
+                               queue_size=queue_size))
+
+    def unbatch(self, name=None, queue_size=QUEUE_SIZE):
+        """
+        Adds a stage that flattens iterable items into their elements.
+        """
+        return self._add(Stage("unbatch", name or "unbatch", queue_size=queue_size))
+
+    def sink(self, function, workers=1, processes=False, name=None):
+        """
+        Adds the final stage, which calls function(item) for every item
+        and passes nothing on. The arguments are as for map().
+        """
+        return self._add(Stage("sink", name or f"sink({_name(function)})", function,
+                               workers=workers, processes=processes, queue_size=1))
+
+    def __iter__(self):
+        """
+        Runs the pipeline, yielding the output of its last stage on the
+        caller's thread. Stopping early stops every stage and closes the
+        source. An exception in any stage is re-raised here.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("pipeline is already running")
+        stop = threading.Event()
+        errors = []
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        threads = []
+        try:
+            for i, stage in enumerate(self.stages):
+                stage.reset_metrics()
+                inbox = queues[i - 1] if i else None
+                thread = threading.Thread(
+                    target=self._run_stage, args=(stage, inbox, queues[i], stop, errors),
+                    name=f"pipeline-{stage.name}", daemon=True)
+                threads.append(thread)
+                thread.start()
+            outbox = queues[-1]
+            while True:
+                try:
+                    item = outbox.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if item is _END:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self._lock.release()
+        if errors:
+            raise errors[0]
+
+    def run(self):
+        """
+        Runs the pipeline to completion, discarding the output of its
+        last stage (there is none after a sink).
+
+        Returns:
+            The per-stage metrics, as from metrics().
+        """
+        for _ in self:
+            pass
+        return self.metrics()
+
+    def metrics(self):
+        """
+        Returns:
+            A list with the metrics dict of every stage, in order (see
+            Stage.metrics), from the last or current run.
+        """
+        return [stage.metrics() for stage in self.stages]
+
+    def bottleneck(self):
+        """
+        Returns:
+            The name of the stage with the highest busy fraction.
+        """
+        return max(self.metrics(), key=lambda metrics: metrics["busy"])["stage"]
+
+    def report(self):
+        """
+        Prints the per-stage metrics and the bottleneck stage.
+        """
+        print(f"{'stage':<32} {'in':>9} {'out':>9} {'items/s':>11} {'busy':>6} "
+              f"{'wait in':>8} {'wait out':>8} {'queue':>11}")
+        for metrics in self.metrics():
+            print(f"{metrics['stage'][:32]:<32} {metrics['items_in']:>9} {metrics['items_out']:>9} "
+                  f"{metrics['throughput']:>11,.0f} {metrics['busy']:>6.0%} "
+                  f"{metrics['wait_in']:>7.2f}s {metrics['wait_out']:>7.2f}s "
+                  f"{metrics['queue_mean']:>5.1f}/{metrics['queue_max']:<5}")
+        print(f"Bottleneck: {self.bottleneck()}")
+
+    @staticmethod
+    def _run_stage(stage, inbox, outbox, stop, errors):
+        """
+        The body of a stage's thread: feeds the input queue through the
+        stage into the output queue, then ends the output with _END.
+        """
+        started = time.perf_counter()
+
+        def receive():
+            while True:
+                depth = inbox.qsize()
+                stage.queue_samples += 1
+                stage.queue_total += depth
+                stage.queue_max = max(stage.queue_max, depth)
+                waited = time.perf_counter()
+                while True:
+                    try:
+                        item = inbox.get(timeout=POLL_INTERVAL)
+                        break
+                    except queue.Empty:
+                        if stop.is_set():
+                            raise _Stopped()
+                stage.wait_in += time.perf_counter() - waited
+                if item is _END:
+                    return
+                stage.items_in += 1
+                yield item
+
+        def send(item):
+            waited = time.perf_counter()
+            while True:
+                try:
+                    outbox.put(item, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        raise _Stopped()
+            stage.wait_out += time.perf_counter() - waited
+
+        output = stage.process(receive() if inbox is not None else None)
+        try:
+            for item in output:
+                stage.items_out += 1
+                if stage.kind != "sink":
+                    send(item)
+            if stage.kind == "source":
+                stage.items_in = stage.items_out
+            send(_END)
+        except _Stopped:
+            pass
+        except BaseException as err:
+            errors.append(err)
+            stop.set()
+        finally:
+            # Closes the source on this thread, releasing its connection
+            output.close()
+            stage.elapsed = time.perf_counter() - started
+
+
+def _name(function):
+    return getattr(function, "__name__", type(function).__name__)
+
+
+if __name__ == "__main__":
+    def describe(row):
+        return f"{row[1]} <{row[2]}>"
+
+    rows = []
+    pipeline = (Pipeline.from_user_batches(100)
+                .unbatch()
+                .filter(lambda row: row[3] > 25, name="age > 25")
+                .map(describe, workers=4)
+                .batch(50)
+                .sink(rows.extend))
+    pipeline.run()
+    print(f"{len(rows)} users over 25, e.g. {rows[:2]}")
+    pipeline.report()
@@ -0,0 +1,303 @@
+"""
+A thread-safe, process-wide pool of database connections.
+
+Checked-out connections are wrapped in a PooledConnection whose close()
+gives the connection back to the pool instead of closing it, so code
+written against plain connections (connect, use, close) gets pooling
+without changes.
+"""
+import collections
+import os
+import threading
+import time
+import weakref
+
+
+class PoolTimeout(TimeoutError):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class PooledConnection:
+    """
+    A checked-out connection. Attribute access is forwarded to the real
+    connection; close() returns it to its pool.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._pid = os.getpid()
+
+    def __getattr__(self, name):
+        connection = self.__dict__.get("_connection")
+        if connection is None:
+            raise AttributeError(f"{name!r}: connection was returned to the pool")
+        return getattr(connection, name)
+
+    def close(self):
+        """
+        Returns the connection to the pool. Safe to call more than once.
+        In a forked child, a connection checked out by the parent is left
+        alone: it belongs to the parent.
+        """
+        connection, self._connection = self._connection, None
+        if connection is not None and self._pid == os.getpid():
+            self._pool.release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    A bounded pool of connections created by a factory function.
+
+    Idle connections are health-checked when checked out and reset when
+    returned; connections failing either are closed and replaced. Idle
+    connections beyond min_size are closed after idle_timeout seconds,
+    on checkout and return and by a background thread, so a process
+    that stops using the pool after a burst does not keep max_size
+    server connections open. Connections are only opened on demand:
+    min_size is the floor idle eviction stops at, not a number of
+    connections opened up front. When max_size connections are checked
+    out, acquire() waits up to timeout seconds for one to be returned.
+
+    After a fork the pool starts empty in the child, leaving the
+    parent's connections alone.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=30.0,
+                 idle_timeout=300.0, ping=None, reset=None):
+        """
+        Args:
+            connect: A function returning a new connection.
+            min_size: Idle connections idle eviction leaves open; none
+                are opened before they are needed.
+            max_size: The maximum number of open connections.
+            timeout: Seconds acquire() waits for a free connection.
+            idle_timeout: Seconds after which extra idle connections are
+                closed.
+            ping: A function (connection) -> bool telling whether an idle
+                connection is still usable.
+            reset: A function (connection) -> bool preparing a returned
+                connection for reuse; False means it must be discarded.
+        """
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("need 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._ping = ping
+        self._reset = reset
+        self._lock = threading.Condition()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+        self._size = 0
+        self._closed = False
+        self._stats = collections.Counter()
+        self._reaper = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked: the inherited connections belong to the parent
+            self._start()
+
+    def _evict_idle(self, now):
+        """
+        Pops the idle connections that have expired; called with the lock
+        held. The caller closes them outside the lock.
+        """
+        expired = []
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        self._size -= len(expired)
+        self._stats["evictions"] += len(expired)
+        return expired
+
+    def evict_idle(self):
+        """
+        Closes the idle connections beyond min_size that have been idle
+        for longer than idle_timeout. Run periodically by the reaper
+        thread.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            expired = self._evict_idle(time.monotonic())
+        for connection in expired:
+            self._close_quietly(connection)
+
+    def _start_reaper(self):
+        """
+        Starts the idle eviction thread if it is not running in this
+        process; called with the lock held. The thread only holds a weak
+        reference to the pool and stops when the pool is closed or
+        garbage collected.
+        """
+        if self._reaper is None:
+            interval = max(self.idle_timeout / 2, 0.01)
+            self._reaper = threading.Thread(
+                target=_reap, args=(weakref.ref(self), interval, self._pid),
+                name="pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def acquire(self, timeout=None):
+        """
+        Checks out a connection.
+
+        Args:
+            timeout: Seconds to wait for a free connection, or None for
+                the pool's timeout.
+
+        Returns:
+            A PooledConnection.
+
+        Raises:
+            PoolTimeout: If no connection became free in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            with self._lock:
+                self._check_pid()
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                connection = create = None
+                if self._idle:
+                    connection = self._idle.pop()[0]
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"no connection available after {timeout}s")
+                    if not waited:
+                        waited = True
+                        self._stats["waits"] += 1
+                    start = time.monotonic()
+                    self._lock.wait(remaining)
+                    self._stats["wait_time_ms"] += (time.monotonic() - start) * 1000
+            for stale in expired:
+                self._close_quietly(stale)
+
+            if create:
+                try:
+                    connection = self._connect()
+                except BaseException:
+                    self._discard_slot()
+                    raise
+                self._count("creations")
+            elif connection is None:
+                continue
+            elif self._ping is not None and not self._ping(connection):
+                self._count("health_check_failures")
+                self._close_quietly(connection)
+                self._discard_slot()
+                continue
+            self._count("checkouts")
+            return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """
+        Returns a connection to the pool, or closes it if it cannot be
+        reset or the pool is closed.
+        """
+        if self._pid != os.getpid():
+            return
+        reusable = not self._closed
+        if reusable and self._reset is not None:
+            try:
+                reusable = self._reset(connection)
+            except Exception:
+                reusable = False
+        if not reusable:
+            self._close_quietly(connection)
+            self._discard_slot()
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._idle.append((connection, now))
+            self._stats["returns"] += 1
+            self._lock.notify()
+            expired = self._evict_idle(now)
+            if len(self._idle) > self.min_size:
+                self._start_reaper()
+        for stale in expired:
+            self._close_quietly(stale)
+
+    def close(self):
+        """
+        Closes the idle connections; checked-out ones are closed when
+        they are returned.
+        """
+        with self._lock:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        """
+        Returns:
+            A dict of counters (checkouts, returns, creations, waits,
+            wait_time_ms, timeouts, evictions, health_check_failures,
+            discards) and gauges (size, idle, in_use).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(size=self._size, idle=len(self._idle),
+                         in_use=self._size - len(self._idle))
+        for counter in ("checkouts", "returns", "creations", "waits", "wait_time_ms",
+                        "timeouts", "evictions", "health_check_failures", "discards"):
+            stats.setdefault(counter, 0)
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _discard_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._stats["discards"] += 1
+            self._lock.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _reap(pool_ref, interval, pid):
+    """
+    The body of a pool's reaper thread: evicts expired idle connections
+    every interval seconds until the pool is closed, garbage collected,
+    or this is a forked child (which starts its own reaper).
+    """
+    while True:
+        time.sleep(interval)
+        pool = pool_ref()
+        if pool is None or pool._closed or pid != os.getpid():
+            return
+        pool.evict_idle()
+        del pool
@@ -0,0 +1,80 @@
+"""
+Background prefetching (double buffering) for batch generators.
+"""
+import queue
+import threading
+
+# Number of batches fetched ahead of the consumer by default.
+PREFETCH_DEPTH = 2
+
+# Seconds the producer waits on a full buffer before checking whether the
+# consumer has gone away.
+POLL_INTERVAL = 0.1
+
+_ITEM = "item"
+_DONE = "done"
+_ERROR = "error"
+
+
+def prefetch(iterable, depth=PREFETCH_DEPTH):
+    """
+    A generator that iterates over iterable on a background thread,
+    keeping up to depth items ready while the consumer works on the
+    current one. This overlaps the database fetch of the next batches
+    with the processing of the current batch.
+
+    At most depth + 2 items are alive at once (the buffer, the one being
+    produced and the one being consumed). Exceptions raised by the source
+    are re-raised in the consumer. When the consumer stops early, the
+    background thread is stopped and the source is closed on that thread,
+    so a generator source releases its cursor and connection.
+
+    Args:
+        iterable: The source, e.g. stream_users_in_batches(1000).
+        depth: The number of items to fetch ahead.
+
+    Yields:
+        The items of iterable, in order.
+    """
+    if depth < 1:
+        raise ValueError("depth must be at least 1")
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(message):
+        while not stop.is_set():
+            try:
+                buffer.put(message, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((_ITEM, item)):
+                    return
+            put((_DONE, None))
+        except BaseException as err:
+            put((_ERROR, err))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, payload = buffer.get()
+            if kind == _ITEM:
+                yield payload
+            elif kind == _DONE:
+                return
+            else:
+                raise payload
+    finally:
+        stop.set()
+        producer.join()
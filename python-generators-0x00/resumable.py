@@ -0,0 +1,150 @@
+"""
+Resumable scans of the user_data table.
+
+The scan reads keyset pages in user_id order, and after every batch it
+hands out an opaque checkpoint token: the last user_id it has returned.
+Passing a token back resumes the scan right after that row, in this
+process or in a later one. Transient errors (a dropped connection, a
+deadlock, a locked SQLite file) are retried on a new connection from the
+last checkpoint, so long exports survive network blips without
+reprocessing or skipping rows.
+"""
+import base64
+import json
+import time
+
+import seed
+
+# Retries of a page after a transient error, and the first delay between
+# them in seconds (doubled after every retry).
+MAX_RETRIES = 5
+RETRY_DELAY = 0.5
+
+CHECKPOINT_VERSION = 1
+
+
+def encode_checkpoint(user_id):
+    """
+    Returns the checkpoint token for a position just after user_id.
+    """
+    payload = json.dumps({"v": CHECKPOINT_VERSION, "after": user_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_checkpoint(checkpoint):
+    """
+    Returns the user_id a checkpoint token resumes after.
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(checkpoint.encode()))
+        if payload["v"] != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version {payload['v']}")
+        return payload["after"]
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Invalid checkpoint {checkpoint!r}: {err}") from err
+
+
+def checkpoint_for(row):
+    """
+    Returns the checkpoint token that resumes a scan right after row.
+    """
+    return encode_checkpoint(row[0])
+
+
+def stream_users_resumable_batches(batch_size=seed.STREAM_FETCH_SIZE, checkpoint=None, where=None,
+                                   max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+    """
+    A generator that streams users in user_id order, in batches, each
+    with the checkpoint that resumes after it.
+
+    Args:
+        batch_size: The number of rows per batch.
+        checkpoint: A token from a previous scan to resume from, or None
+            to start at the beginning.
+        where: Extra (column, operator, value) conditions, or None.
+        max_retries: Attempts per batch after a transient error.
+        retry_delay: The delay before the first retry, in seconds.
+
+    Yields:
+        A (batch, checkpoint) tuple, batch being a list of row tuples.
+
+    Raises:
+        The database error, once a batch has failed max_retries times or
+        on a non-transient error. Resume with the last checkpoint.
+    """
+    last_id = decode_checkpoint(checkpoint) if checkpoint is not None else None
+    current = seed.get_current_backend()
+    conn = None
+    try:
+        while True:
+            conditions = list(where or ())
+            if last_id is not None:
+                conditions.append(("user_id", ">", last_id))
+            query, params = seed.build_select(where=conditions)
+            query += " ORDER BY user_id LIMIT %s"
+
+            attempt = 0
+            while True:
+                cursor = None
+                try:
+                    if conn is None:
+                        conn = seed.open_connection()
+                    cursor = conn.cursor()
+                    cursor.execute(query, params + (batch_size,))
+                    batch = cursor.fetchall()
+                    cursor.close()
+                    break
+                except seed.DB_ERRORS as err:
+                    if not current.is_transient(err) or attempt >= max_retries:
+                        raise
+                    print(f"Transient error, reconnecting and resuming: {err}")
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except seed.DB_ERRORS:
+                            pass
+                        conn = None
+                    time.sleep(retry_delay * 2 ** attempt)
+                    attempt += 1
+
+            if not batch:
+                return
+            last_id = batch[-1][0]
+            yield batch, encode_checkpoint(last_id)
+            if len(batch) < batch_size:
+                return
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def stream_users_resumable(checkpoint=None, batch_size=seed.STREAM_FETCH_SIZE, where=None,
+                           max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+    """
+    A generator that streams users one by one in user_id order, resuming
+    after checkpoint if given. checkpoint_for(row) gives the token to
+    resume after any yielded row. See stream_users_resumable_batches()
+    for the other arguments.
+
+    Yields:
+        A tuple representing a single row.
+    """
+    for batch, _ in stream_users_resumable_batches(batch_size, checkpoint, where,
+                                                   max_retries, retry_delay):
+        yield from batch
+
+
+if __name__ == "__main__":
+    token = None
+    for i, (batch, token) in enumerate(stream_users_resumable_batches(100)):
+        print(f"Batch {i+1}: {len(batch)} rows, checkpoint {token}")
+        if i >= 2:
+            break
+    print("\nResuming from the last checkpoint...")
+    for i, (batch, token) in enumerate(stream_users_resumable_batches(100, token)):
+        print(f"Batch {i+1}: {len(batch)} rows, first user {batch[0][0]}")
+        if i >= 1:
+            break
@@ -1,6 +1,22 @@
-import mysql.connector
+import concurrent.futures
 import csv
+import hashlib
+import itertools
+import os
+import sys
+import threading
+import time
 import uuid
+from decimal import Decimal
+
+import fast_csv
+from backends import DB_ERRORS, get_backend
+from pool import ConnectionPool, PoolTimeout
+
+try:
+    import resource
+except ImportError:  # resource is Unix-only; peak_memory_mb() is None on Windows
+    resource = None
 
 # MySQL connection details.
 # IMPORTANT: Replace with your actual database credentials.
@@ -10,24 +26,147 @@ PASSWORD = "password"
 DATABASE_NAME = "ALX_prodev"
 TABLE_NAME = "user_data"
 
+# The database to use, as a connection URL (see backends.get_backend).
+# Set DATABASE_URL to e.g. sqlite:///prodev.db to run without MySQL.
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL", f"mysql://{USER}:{PASSWORD}@{HOST}/{DATABASE_NAME}")
+
+# Process-wide connection pool behind connect_to_prodev. Set DB_POOL=0
+# to open a new connection on every call instead.
+POOL_ENABLED = os.environ.get("DB_POOL", "1") != "0"
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_TIMEOUT = 30.0
+POOL_IDLE_TIMEOUT = 300.0
+
+# Columns of the user_data table, in table order.
+USER_COLUMNS = ("user_id", "name", "email", "age")
+
+# Secondary indexes of user_data, one per non-key column that keyset
+# pagination may order by (see 2-lazy_paginate.py). user_id is included
+# so that seeking past a (value, user_id) position is an index range scan.
+USER_DATA_INDEXES = {
+    "name": "idx_user_data_name",
+    "email": "idx_user_data_email",
+    "age": "idx_user_data_age",
+}
+
+# Comparison operators accepted in build_select() filters.
+FILTER_OPERATORS = ("=", "!=", "<", "<=", ">", ">=", "IN", "NOT IN", "LIKE")
+
+# Decimal places of the age column, DECIMAL(5, 2). CompactUser stores
+# ages as integers in units of 10 ** -AGE_SCALE.
+AGE_SCALE = 2
+
+# Side table holding the content hash of every row written by
+# incremental_insert_data, used to skip unchanged rows on re-seeding, and
+# the sequence number of its last change, used by change_feed.py.
+SEED_STATE_TABLE = "user_data_seed_state"
+SEED_STATE_SEQ_INDEX = "idx_seed_state_seq"
+
+# Namespace of the deterministic user IDs derived from email addresses.
+USER_ID_NAMESPACE = uuid.UUID("6f1c3d2e-8a4b-5c7d-9e0f-1a2b3c4d5e6f")
+
+# Number of CSV rows sent per INSERT/commit by bulk_insert_data.
+INSERT_CHUNK_SIZE = 1000
+
+# Number of rows pulled from the server per round trip by the streaming
+# (unbuffered) cursors.
+STREAM_FETCH_SIZE = 500
+
 seed = __import__('seed')
 
+backend = None
+backend_url = None
+pool = None
+
+# Serializes (re)configuring the backend and pool, so that threads making
+# their first connection at the same time share one pool. Reentrant, as
+# configure_pool() may configure the backend.
+_configure_lock = threading.RLock()
+
+def configure(url=None):
+    """
+    Selects the database backend used by every connect function. Any
+    existing connection pool is closed.
+
+    Args:
+        url: A connection URL, or None for DATABASE_URL.
+
+    Returns:
+        The backend object.
+    """
+    global backend, backend_url, pool
+    with _configure_lock:
+        backend_url = url or DATABASE_URL
+        backend = get_backend(backend_url)
+        if pool is not None:
+            pool.close()
+            pool = None
+        return backend
+
+def configure_pool(enabled=True, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                   timeout=POOL_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT):
+    """
+    (Re)creates the connection pool behind connect_to_prodev, closing the
+    previous one.
+
+    Args:
+        enabled: False to disable pooling.
+        min_size: Idle connections idle eviction leaves open (they
+            are opened on demand, not up front).
+        max_size: The maximum number of open connections.
+        timeout: Seconds a checkout waits for a free connection.
+        idle_timeout: Seconds after which extra idle connections close.
+
+    Returns:
+        The new ConnectionPool, or None when disabled.
+    """
+    global POOL_ENABLED, pool
+    with _configure_lock:
+        POOL_ENABLED = enabled
+        if pool is not None:
+            pool.close()
+            pool = None
+        if enabled:
+            current = get_current_backend()
+            pool = ConnectionPool(
+                current.connect, min_size=min_size, max_size=max_size, timeout=timeout,
+                idle_timeout=idle_timeout, ping=current.ping, reset=current.reset)
+        return pool
+
+def pool_stats():
+    """
+    Returns the connection pool's stats (see ConnectionPool.stats), or
+    None when pooling is disabled.
+    """
+    if pool is None:
+        return None
+    return pool.stats()
+
+def get_current_backend():
+    """
+    Returns the configured backend, configuring it from DATABASE_URL on
+    first use.
+    """
+    if backend is None:
+        with _configure_lock:
+            if backend is None:
+                configure()
+    return backend
+
 def connect_db():
     """
-    Connects to the MySQL database server.
+    Connects to the database server (for SQLite, to the database file).
     
     Returns:
         A connection object if successful, None otherwise.
     """
     try:
-        connection = mysql.connector.connect(
-            host=HOST,
-            user=USER,
-            password=PASSWORD
-        )
-        print("Successfully connected to the MySQL server.")
+        connection = get_current_backend().connect_server()
+        print(f"Successfully connected to the {backend.name} server.")
         return connection
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error: {err}")
         return None
 
@@ -36,47 +175,62 @@ def create_database(connection):
     Creates the specified database if it does not already exist.
 
     Args:
-        connection: The MySQL server connection object.
+        connection: The server connection object.
     """
     try:
-        cursor = connection.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DATABASE_NAME}")
-        print(f"Database '{DATABASE_NAME}' created or already exists.")
-    except mysql.connector.Error as err:
+        get_current_backend().create_database(connection)
+        print(f"Database '{backend.database}' created or already exists.")
+    except DB_ERRORS as err:
         print(f"Error creating database: {err}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
+
+def open_connection():
+    """
+    Returns a connection to the ALX_prodev database, from the pool unless
+    pooling is disabled. Unlike connect_to_prodev, errors are raised.
+
+    Raises:
+        PoolTimeout: If the pool has no free connection in time.
+        One of DB_ERRORS: If the connection fails.
+    """
+    current = pool
+    if POOL_ENABLED and current is None:
+        with _configure_lock:
+            if POOL_ENABLED and pool is None:
+                configure_pool()
+            current = pool
+    if current is not None:
+        # close() on a pooled connection returns it to the pool
+        return current.acquire()
+    return get_current_backend().connect()
 
 def connect_to_prodev():
     """
-    Connects to the ALX_prodev database in MySQL.
+    Connects to the ALX_prodev database. Unless pooling is disabled, the
+    connection is checked out of the process-wide pool and closing it
+    returns it there.
 
     Returns:
         A connection object if successful, None otherwise.
     """
     try:
-        connection = mysql.connector.connect(
-            host=HOST,
-            user=USER,
-            password=PASSWORD,
-            database=DATABASE_NAME
-        )
-        print(f"Successfully connected to the '{DATABASE_NAME}' database.")
+        connection = open_connection()
+        print(f"Successfully connected to the '{backend.database}' database.")
         return connection
-    except mysql.connector.Error as err:
-        print(f"Error connecting to '{DATABASE_NAME}': {err}")
+    except (PoolTimeout,) + DB_ERRORS as err:
+        print(f"Error connecting to '{backend.database}': {err}")
         return None
 
 
 def create_table(connection):
     """
-    Creates the 'user_data' table with the required fields.
+    Creates the 'user_data' table with the required fields, and any of
+    its USER_DATA_INDEXES that are missing.
 
     Args:
         connection: The database connection object.
     """
     try:
+        current = get_current_backend()
         cursor = connection.cursor()
         create_table_query = f"""
         CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
@@ -87,9 +241,13 @@ def create_table(connection):
         )
         """
         cursor.execute(create_table_query)
+        existing = {name for name, _ in current.secondary_indexes(connection, TABLE_NAME)}
+        for column, name in USER_DATA_INDEXES.items():
+            if name not in existing:
+                cursor.execute(f"CREATE INDEX {name} ON {TABLE_NAME} ({column}, user_id)")
         connection.commit()
         print(f"Table '{TABLE_NAME}' created or already exists.")
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error creating table: {err}")
     finally:
         if 'cursor' in locals() and cursor:
@@ -126,10 +284,10 @@ def insert_data(connection, data_file="userdata.csv"):
                     cursor.execute(insert_query, data_tuple)
                     connection.commit()
                     print(f"Inserted row for user: {row[0]}")
-                except mysql.connector.Error as err:
+                except DB_ERRORS as err:
                     print(f"Error inserting data for row {row}: {err}")
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Database error during insertion: {err}")
     except FileNotFoundError:
         print(f"Error: The file '{data_file}' was not found.")
@@ -137,37 +295,594 @@ def insert_data(connection, data_file="userdata.csv"):
         if 'cursor' in locals() and cursor:
             cursor.close()
 
-def stream_user_rows(connection):
+def read_csv_rows(data_file="userdata.csv"):
     """
-    A generator function that streams rows from the 'user_data' table
-    one by one, to conserve memory.
+    A generator that reads the CSV file lazily, one row at a time,
+    skipping the header row.
+
+    Args:
+        data_file: The path to the CSV file.
+
+    Yields:
+        A tuple of (name, email, age) strings for each CSV row.
+    """
+    with open(data_file, 'r', newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip the header row
+        for row in reader:
+            yield tuple(row)
+
+
+def csv_rows(data_file="userdata.csv", fast=False):
+    """
+    Returns a lazy iterator over the data rows of a CSV file, read with
+    read_csv_rows() or, with fast=True, the memory-mapped fast_csv reader.
+    """
+    if fast:
+        return fast_csv.iter_rows(data_file)
+    return read_csv_rows(data_file)
+
+
+def chunked(iterable, chunk_size):
+    """
+    Splits an iterable into lists of at most chunk_size items without
+    ever holding more than one chunk in memory.
+
+    Args:
+        iterable: Any iterable, e.g. a generator of rows.
+        chunk_size: The maximum number of items per chunk.
+
+    Yields:
+        A list of up to chunk_size items.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def bulk_insert_rows(connection, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Inserts (name, email, age) rows into the 'user_data' table in chunks,
+    using one executemany() call and one commit per chunk.
+
+    Rows without exactly three fields are rejected up front. If a chunk
+    fails, its rows are retried one by one so that only the bad rows are
+    rejected.
+
+    Args:
+        connection: The database connection object.
+        rows: An iterable of (name, email, age) tuples.
+        chunk_size: The number of rows sent per INSERT and commit.
+
+    Returns:
+        A (inserted, rejected) tuple with the number of rows written and
+        the number of rows that could not be inserted.
+    """
+    insert_query = f"INSERT INTO {TABLE_NAME} (user_id, name, email, age) VALUES (%s, %s, %s, %s)"
+    inserted = 0
+    rejected = 0
+    cursor = connection.cursor()
+    try:
+        for chunk in chunked(rows, chunk_size):
+            data = [(str(uuid.uuid4()),) + tuple(row) for row in chunk if len(row) == 3]
+            rejected += len(chunk) - len(data)
+            try:
+                cursor.executemany(insert_query, data)
+                connection.commit()
+                inserted += len(data)
+            except DB_ERRORS as err:
+                connection.rollback()
+                print(f"Error inserting chunk of {len(data)} rows, retrying row by row: {err}")
+                for data_tuple in data:
+                    try:
+                        cursor.execute(insert_query, data_tuple)
+                        connection.commit()
+                        inserted += 1
+                    except DB_ERRORS as row_err:
+                        connection.rollback()
+                        rejected += 1
+                        print(f"Error inserting data for row {data_tuple[1:]}: {row_err}")
+    finally:
+        cursor.close()
+    return inserted, rejected
+
+
+def _load_range(url, data_file, start, end, chunk_size):
+    """
+    Parallel loader worker: bulk inserts the CSV rows in one byte range
+    over its own connection.
+
+    Returns:
+        A dict with the worker's rows, rejected rows and seconds.
+    """
+    current = backend if url == backend_url and backend is not None else configure(url)
+    began = time.perf_counter()
+    connection = current.connect()
+    try:
+        rows, rejected = bulk_insert_rows(
+            connection, fast_csv.iter_range_rows(data_file, start, end), chunk_size)
+    finally:
+        connection.close()
+    return {"rows": rows, "rejected": rejected, "seconds": time.perf_counter() - began}
+
+
+def parallel_insert_data(data_file="userdata.csv", workers=4, chunk_size=INSERT_CHUNK_SIZE,
+                         use_processes=False, defer_indexes=False):
+    """
+    Bulk loads a CSV file into the 'user_data' table with several worker
+    connections. The file is split into line-aligned byte ranges (see
+    fast_csv.split_ranges) and each worker parses its range and inserts
+    it in chunks, one executemany() and commit per chunk.
+
+    With defer_indexes, the table's secondary indexes are dropped before
+    the load and rebuilt once afterwards, instead of being maintained row
+    by row. Prints one report for the whole load.
+
+    Args:
+        data_file: The path to the CSV file.
+        workers: The number of worker connections.
+        chunk_size: The number of rows sent per INSERT and commit.
+        use_processes: Use a process pool instead of a thread pool, for
+            when parsing rather than the database is the bottleneck.
+        defer_indexes: Rebuild secondary indexes after the load.
+
+    Returns:
+        A dict with rows, rejected, seconds and a per-worker list of
+        dicts, or None if the load could not start.
+    """
+    current = get_current_backend()
+    try:
+        ranges = fast_csv.split_ranges(data_file, workers)
+    except FileNotFoundError:
+        print(f"Error: The file '{data_file}' was not found.")
+        return None
+
+    indexes = []
+    began = time.perf_counter()
+    try:
+        if defer_indexes:
+            connection = current.connect()
+            try:
+                indexes = current.secondary_indexes(connection, TABLE_NAME)
+                cursor = connection.cursor()
+                for name, _ in indexes:
+                    cursor.execute(current.drop_index_query(name, TABLE_NAME))
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+
+        executor_class = (concurrent.futures.ProcessPoolExecutor if use_processes
+                          else concurrent.futures.ThreadPoolExecutor)
+        with executor_class(max_workers=max(len(ranges), 1)) as executor:
+            futures = [executor.submit(_load_range, backend_url, data_file, start, end, chunk_size)
+                       for start, end in ranges]
+            per_worker = [future.result() for future in futures]
+    except DB_ERRORS as err:
+        print(f"Database error during parallel insertion: {err}")
+        return None
+    finally:
+        if indexes:
+            connection = current.connect()
+            try:
+                cursor = connection.cursor()
+                for _, create_query in indexes:
+                    cursor.execute(create_query)
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+
+    elapsed = time.perf_counter() - began
+    rows = sum(worker["rows"] for worker in per_worker)
+    rejected = sum(worker["rejected"] for worker in per_worker)
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Loaded {rows} rows ({rejected} rejected) with {len(per_worker)} workers "
+          f"in {elapsed:.2f}s [{rate:,.0f} rows/s]"
+          + (f", rebuilt {len(indexes)} index(es)" if indexes else ""))
+    for i, worker in enumerate(per_worker):
+        worker_rate = worker["rows"] / worker["seconds"] if worker["seconds"] > 0 else 0.0
+        print(f"  worker {i + 1}: {worker['rows']} rows, {worker['rejected']} rejected, "
+              f"{worker['seconds']:.2f}s [{worker_rate:,.0f} rows/s]")
+    return {"rows": rows, "rejected": rejected, "seconds": elapsed, "workers": per_worker}
+
+
+def user_id_for(email):
+    """
+    Returns the deterministic user_id of a user: a UUID5 of the
+    normalized email, the natural key of the CSV, so re-seeding the same
+    user always produces the same ID.
+    """
+    return str(uuid.uuid5(USER_ID_NAMESPACE, email.strip().lower()))
+
+
+def row_hash(row):
+    """
+    Returns a content hash of a (name, email, age) CSV row, over the
+    values exactly as they are upserted, so an edit that only changes
+    whitespace is still written.
+    """
+    content = "\x1f".join(str(field) for field in row)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def create_seed_state_table(connection):
+    """
+    Creates the side table that incremental_insert_data uses to track
+    the content hash and change sequence number of every user it has
+    written. A table created before sequence numbers existed gets the
+    seq column (0 for its existing rows) and its index added.
+
+    Args:
+        connection: The database connection object.
+    """
+    current = get_current_backend()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SEED_STATE_TABLE} (
+            user_id VARCHAR(36) PRIMARY KEY,
+            row_hash CHAR(32) NOT NULL,
+            seq BIGINT NOT NULL DEFAULT 0
+        )
+        """)
+        cursor.execute(f"SELECT * FROM {SEED_STATE_TABLE} LIMIT 0")
+        cursor.fetchall()
+        if "seq" not in [column[0] for column in cursor.description]:
+            cursor.execute(f"ALTER TABLE {SEED_STATE_TABLE} ADD COLUMN seq BIGINT NOT NULL DEFAULT 0")
+        indexes = [name for name, _ in current.secondary_indexes(connection, SEED_STATE_TABLE)]
+        if SEED_STATE_SEQ_INDEX not in indexes:
+            cursor.execute(f"CREATE INDEX {SEED_STATE_SEQ_INDEX} ON {SEED_STATE_TABLE} (seq)")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def incremental_insert_rows(connection, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Upserts (name, email, age) rows into the 'user_data' table, skipping
+    rows whose content has not changed since they were last written.
+
+    Each chunk costs one lookup of the stored hashes, and the changed rows
+    are upserted with one executemany() per table and one commit, so a
+    re-seed only writes the delta. Rows are keyed by user_id_for(email).
+    Every written row gets the next change sequence number, so readers
+    of change_feed.py see it as changed. Sequence numbers are only
+    increasing if a single seeder runs at a time.
+
+    Args:
+        connection: The database connection object.
+        rows: An iterable of (name, email, age) tuples.
+        chunk_size: The number of rows per lookup, upsert and commit.
+
+    Returns:
+        A (written, unchanged, rejected) tuple of row counts.
+    """
+    current = get_current_backend()
+    upsert_users = current.upsert_query(TABLE_NAME, USER_COLUMNS, ("user_id",))
+    upsert_hashes = current.upsert_query(SEED_STATE_TABLE, ("user_id", "row_hash", "seq"),
+                                         ("user_id",))
+    written = unchanged = rejected = 0
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {SEED_STATE_TABLE}")
+        last_seq = cursor.fetchone()[0]
+        for chunk in chunked(rows, chunk_size):
+            # Malformed rows (e.g. blank lines) are rejected, as in
+            # bulk_insert_rows; later duplicates of an email in the same
+            # chunk win
+            valid = [row for row in chunk if len(row) == 3]
+            rejected += len(chunk) - len(valid)
+            latest = {}
+            for row in valid:
+                latest[user_id_for(row[1])] = (tuple(row), row_hash(row))
+            unchanged += len(valid) - len(latest)
+            if not latest:
+                continue
+            try:
+                placeholders = ", ".join(["%s"] * len(latest))
+                cursor.execute(
+                    f"SELECT user_id, row_hash FROM {SEED_STATE_TABLE} "
+                    f"WHERE user_id IN ({placeholders})", tuple(latest))
+                stored = dict(cursor.fetchall())
+                changed = [(user_id, row, digest) for user_id, (row, digest) in latest.items()
+                           if stored.get(user_id) != digest]
+                unchanged += len(latest) - len(changed)
+                if changed:
+                    cursor.executemany(upsert_users, [(user_id,) + row for user_id, row, _ in changed])
+                    cursor.executemany(upsert_hashes, [
+                        (user_id, digest, last_seq + i)
+                        for i, (user_id, _, digest) in enumerate(changed, start=1)])
+                connection.commit()
+                last_seq += len(changed)
+                written += len(changed)
+            except DB_ERRORS as err:
+                connection.rollback()
+                rejected += len(latest)
+                print(f"Error upserting chunk of {len(latest)} rows: {err}")
+    finally:
+        cursor.close()
+    return written, unchanged, rejected
+
+
+def incremental_insert_data(connection, data_file="userdata.csv", chunk_size=INSERT_CHUNK_SIZE,
+                            fast=False):
+    """
+    Idempotently (re-)seeds the 'user_data' table from a CSV file. Users
+    get deterministic IDs derived from their email, and only new or
+    changed rows are written, so running it again is cheap and never
+    duplicates users. Prints the counts and rows/s when done.
+
+    The table should only contain rows written by this function: rows
+    loaded by insert_data or bulk_insert_data have random IDs and are not
+    matched.
+
+    Args:
+        connection: The database connection object.
+        data_file: The path to the CSV file.
+        chunk_size: The number of rows per lookup, upsert and commit.
+        fast: Read the file with the memory-mapped fast_csv reader.
+
+    Returns:
+        The number of rows written.
+    """
+    start = time.perf_counter()
+    try:
+        create_seed_state_table(connection)
+        written, unchanged, rejected = incremental_insert_rows(
+            connection, csv_rows(data_file, fast), chunk_size)
+    except DB_ERRORS as err:
+        print(f"Database error during incremental seeding: {err}")
+        return 0
+    except FileNotFoundError:
+        print(f"Error: The file '{data_file}' was not found.")
+        return 0
+    elapsed = time.perf_counter() - start
+    total = written + unchanged + rejected
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Seeded {total} rows in {elapsed:.2f}s: {written} written, "
+          f"{unchanged} unchanged, {rejected} rejected [{rate:,.0f} rows/s]")
+    return written
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident set size of the current process in MiB,
+    or None where it is not available (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def bulk_insert_data(connection, data_file="userdata.csv", chunk_size=INSERT_CHUNK_SIZE,
+                     fast=False):
+    """
+    Bulk loads a CSV file into the 'user_data' table. The file is read
+    lazily and inserted chunk by chunk, so memory use stays flat no matter
+    how large the file is. Prints rows/s and peak memory when done.
+
+    Args:
+        connection: The database connection object.
+        data_file: The path to the CSV file.
+        chunk_size: The number of rows sent per INSERT and commit.
+        fast: Read the file with the memory-mapped fast_csv reader.
+
+    Returns:
+        The number of rows inserted.
+    """
+    start = time.perf_counter()
+    try:
+        inserted, rejected = bulk_insert_rows(
+            connection, csv_rows(data_file, fast), chunk_size)
+    except DB_ERRORS as err:
+        print(f"Database error during bulk insertion: {err}")
+        return 0
+    except FileNotFoundError:
+        print(f"Error: The file '{data_file}' was not found.")
+        return 0
+    elapsed = time.perf_counter() - start
+    rate = inserted / elapsed if elapsed > 0 else 0.0
+    peak = peak_memory_mb()
+    print(f"Inserted {inserted} rows ({rejected} rejected) in {elapsed:.2f}s "
+          f"[{rate:,.0f} rows/s, chunk_size={chunk_size}"
+          + (f", peak memory {peak:.1f} MiB]" if peak is not None else "]"))
+    return inserted
+
+
+def build_select(columns=None, where=None, table=TABLE_NAME):
+    """
+    Compiles a projection and a declarative filter into a parameterized
+    SELECT statement, so that only the needed columns of the matching
+    rows are sent by the server.
+
+    The filter is a list of (column, operator, value) conditions that are
+    ANDed together, e.g. [("age", ">", 25), ("name", "LIKE", "A%")].
+    Column names and operators are checked against USER_COLUMNS and
+    FILTER_OPERATORS; values are always bound as parameters. IN and
+    NOT IN take a non-empty sequence of values.
+
+    Args:
+        columns: The columns to select, or None for all of them.
+        where: The filter conditions, or None for all rows.
+        table: The table to select from.
+
+    Returns:
+        A (query, params) tuple.
+    """
+    columns = tuple(columns) if columns else USER_COLUMNS
+    for column in columns:
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+
+    clauses = []
+    params = []
+    for column, operator, value in where or ():
+        operator = operator.upper()
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported operator: {operator!r}")
+        if operator in ("IN", "NOT IN"):
+            values = tuple(value)
+            if not values:
+                raise ValueError(f"{operator} needs at least one value")
+            placeholders = ", ".join(["%s"] * len(values))
+            clauses.append(f"{column} {operator} ({placeholders})")
+            params.extend(values)
+        else:
+            clauses.append(f"{column} {operator} %s")
+            params.append(value)
+
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return query, tuple(params)
+
+
+def stream_batches(connection, query, params=(), fetch_size=STREAM_FETCH_SIZE, drain=True):
+    """
+    A generator that runs a query on an unbuffered cursor and yields the
+    result in batches of at most fetch_size rows. Only one batch is held
+    in client memory at a time, so the time to the first row and the
+    memory use do not grow with the size of the table.
+
+    If the consumer stops early, the rest of the result set has to be
+    read off the connection before it can run another query. With
+    drain=True (for connections owned by the caller) the remaining rows
+    are discarded; with drain=False the caller must close the connection
+    instead, which is cheaper for large result sets.
 
     Args:
         connection: The database connection object.
+        query: The SELECT statement to run.
+        params: The query parameters.
+        fetch_size: The number of rows fetched per round trip.
+        drain: Whether to consume unread rows when stopped early.
 
     Yields:
-        A tuple representing a single row from the database.
+        A list of up to fetch_size row tuples.
     """
-    cursor = None
+    cursor = connection.cursor(buffered=False)
+    exhausted = False
     try:
-        # Use buffered=True for fetching rows one at a time for large datasets
-        cursor = connection.cursor(buffered=True)
-        query = f"SELECT * FROM {TABLE_NAME}"
-        cursor.execute(query)
-        
+        cursor.execute(query, params)
         while True:
-            row = cursor.fetchone()
-            if row is None:
-                # No more rows to fetch, stop the generator
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                exhausted = True
                 break
-            yield row
-    except mysql.connector.Error as err:
-        print(f"Error streaming data: {err}")
+            yield batch
     finally:
-        if cursor:
+        if not exhausted and drain:
+            connection.consume_results()
+            exhausted = True
+        if exhausted:
             cursor.close()
 
 
+def stream_rows(connection, query, params=(), fetch_size=STREAM_FETCH_SIZE, drain=True):
+    """
+    A generator that runs a query on an unbuffered cursor and yields the
+    result one row at a time. See stream_batches() for the semantics of
+    fetch_size and drain.
+
+    Yields:
+        A tuple representing a single row.
+    """
+    for batch in stream_batches(connection, query, params, fetch_size, drain):
+        yield from batch
+
+
+class CompactUser:
+    """
+    A memory-compact user_data row.
+
+    The UUID is kept as its 16 raw bytes and the age as a fixed-point
+    integer (hundredths), in a slotted object without a per-instance
+    dict. The usual string and Decimal values are rebuilt on access, and
+    as_tuple() converts back to the row tuple only when needed.
+    """
+    __slots__ = ("user_id_bytes", "name", "email", "age_units")
+
+    def __init__(self, user_id_bytes, name, email, age_units):
+        self.user_id_bytes = user_id_bytes
+        self.name = name
+        self.email = email
+        self.age_units = age_units
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a CompactUser from a (user_id, name, email, age) tuple.
+        """
+        user_id, name, email, age = row
+        if not isinstance(age, Decimal):
+            age = Decimal(str(age))
+        return cls(uuid.UUID(user_id).bytes, name, email, int(age.scaleb(AGE_SCALE)))
+
+    @property
+    def user_id(self):
+        return str(uuid.UUID(bytes=self.user_id_bytes))
+
+    @property
+    def age(self):
+        return Decimal(self.age_units).scaleb(-AGE_SCALE)
+
+    def as_tuple(self):
+        """
+        Returns the row as a (user_id, name, email, age) tuple.
+        """
+        return (self.user_id, self.name, self.email, self.age)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactUser):
+            return NotImplemented
+        return (self.user_id_bytes, self.name, self.email, self.age_units) == \
+            (other.user_id_bytes, other.name, other.email, other.age_units)
+
+    def __hash__(self):
+        return hash((self.user_id_bytes, self.name, self.email, self.age_units))
+
+    def __repr__(self):
+        return f"CompactUser{self.as_tuple()!r}"
+
+
+def stream_user_rows(connection, fetch_size=STREAM_FETCH_SIZE, compact=False):
+    """
+    A generator function that streams rows from the 'user_data' table
+    one by one, to conserve memory.
+
+    Args:
+        connection: The database connection object.
+        fetch_size: The number of rows fetched per round trip.
+        compact: Yield CompactUser objects instead of tuples.
+
+    Yields:
+        A tuple (or CompactUser) representing a single row from the database.
+    """
+    stream = stream_batches(connection, f"SELECT * FROM {TABLE_NAME}",
+                            fetch_size=fetch_size)
+    try:
+        for batch in stream:
+            if compact:
+                yield from map(CompactUser.from_row, batch)
+            else:
+                yield from batch
+    except DB_ERRORS as err:
+        print(f"Error streaming data: {err}")
+    finally:
+        # Drains unread rows so the caller's connection stays usable
+        stream.close()
+
+
 if __name__ == "__main__":
     # 1. Connect to the MySQL server
     server_conn = seed.connect_db()
@@ -186,8 +901,15 @@ if __name__ == "__main__":
     # 4. Create the table
     create_table(db_conn)
 
-    # 5. Insert data from the CSV file
-    insert_data(db_conn)
+    # 5. Insert data from the CSV file, one chunk per commit. With
+    # --incremental, only new or changed users are written.
+    # With --parallel, the file is loaded by one worker connection per CPU.
+    if "--incremental" in sys.argv[1:]:
+        incremental_insert_data(db_conn)
+    elif "--parallel" in sys.argv[1:]:
+        parallel_insert_data(workers=os.cpu_count() or 1, defer_indexes=True)
+    else:
+        bulk_insert_data(db_conn)
 
     print("\n--- Demonstrating Data Streaming with Generator ---")
     
@@ -198,7 +920,9 @@ if __name__ == "__main__":
     for i, row in enumerate(data_stream):
         print(f"Streaming Row {i+1}: {row}")
         if i > 10: break
-    
+    # Release the stream's cursor before closing its connection
+    data_stream.close()
+
     # Close the database connection when finished
     db_conn.close()
     print("\nDatabase connection closed.")
@@ -0,0 +1,284 @@
+"""
+One-pass, bounded-memory summaries of a stream of values.
+
+Each sketch consumes values one at a time, uses memory independent of
+the stream length, and can be merged with another sketch of the same
+kind, so partial results of partitioned or parallel scans can be
+combined into the result of the whole scan.
+"""
+import bisect
+import hashlib
+import math
+import random
+from decimal import Decimal
+
+
+class QuantileSketch:
+    """
+    A KLL quantile sketch.
+
+    Values are kept in a hierarchy of compactors; a full compactor sorts
+    its values and promotes every other one to the next level, where each
+    value stands for twice as many. With the default k=200 the rank error
+    is about 1% and the sketch holds a few hundred values however long
+    the stream is. Values only need to be comparable.
+    """
+
+    def __init__(self, k=200, seed=None):
+        """
+        Args:
+            k: The size of the top compactor; larger is more accurate.
+            seed: A seed for the compaction coin flips, for reproducible
+                results.
+        """
+        self.k = k
+        self.count = 0
+        self._random = random.Random(seed)
+        self._compactors = []
+        self._size = 0
+        self._max_size = 0
+        self._grow()
+
+    def _grow(self):
+        self._compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self._compactors)))
+
+    def _capacity(self, level):
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def add(self, value):
+        """
+        Adds a single value.
+        """
+        self._compactors[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def update(self, values):
+        """
+        Adds every value of an iterable.
+
+        Returns:
+            The sketch, for chaining.
+        """
+        add = self.add
+        for value in values:
+            add(value)
+        return self
+
+    def _compress(self):
+        for level in range(len(self._compactors)):
+            items = self._compactors[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self._compactors):
+                self._grow()
+            items.sort()
+            # An odd item out stays at this level
+            leftover = [items.pop()] if len(items) % 2 else []
+            offset = self._random.randint(0, 1)
+            self._compactors[level + 1].extend(items[offset::2])
+            self._compactors[level] = leftover
+            self._size = sum(len(compactor) for compactor in self._compactors)
+            if self._size < self._max_size:
+                break
+
+    def merge(self, other):
+        """
+        Folds another QuantileSketch into this one.
+
+        Returns:
+            The sketch, for chaining.
+        """
+        while len(self._compactors) < len(other._compactors):
+            self._grow()
+        for level, items in enumerate(other._compactors):
+            self._compactors[level].extend(items)
+        self.count += other.count
+        self._size = sum(len(compactor) for compactor in self._compactors)
+        while self._size >= self._max_size:
+            self._compress()
+        return self
+
+    def _weighted(self):
+        items = [(value, 1 << level)
+                 for level, compactor in enumerate(self._compactors) for value in compactor]
+        items.sort(key=lambda item: item[0])
+        return items
+
+    def quantiles(self, fractions):
+        """
+        Estimates several quantiles at once.
+
+        Args:
+            fractions: Quantile fractions between 0 and 1, e.g. 0.5, 0.99.
+
+        Returns:
+            A list with the estimated value of each quantile, or Nones if
+            the sketch is empty.
+        """
+        items = self._weighted()
+        if not items:
+            return [None for _ in fractions]
+        total = sum(weight for _, weight in items)
+        cumulative = []
+        running = 0
+        for _, weight in items:
+            running += weight
+            cumulative.append(running)
+        results = []
+        for fraction in fractions:
+            if not 0 <= fraction <= 1:
+                raise ValueError(f"quantile fraction out of range: {fraction}")
+            position = bisect.bisect_left(cumulative, fraction * total)
+            results.append(items[min(position, len(items) - 1)][0])
+        return results
+
+    def quantile(self, fraction):
+        """
+        Estimates a single quantile, e.g. quantile(0.5) for the median.
+        """
+        return self.quantiles([fraction])[0]
+
+
+class Histogram:
+    """
+    Counts of values in fixed buckets. Bucket i holds the values v with
+    edges[i] <= v < edges[i + 1]; values below the first edge or at or
+    above the last one are counted as underflow and overflow.
+    """
+
+    def __init__(self, edges):
+        """
+        Args:
+            edges: The increasing bucket boundaries.
+        """
+        self.edges = tuple(edges)
+        if len(self.edges) < 2 or any(a >= b for a, b in zip(self.edges, self.edges[1:])):
+            raise ValueError("edges must be at least two increasing values")
+        self.counts = [0] * (len(self.edges) - 1)
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, value):
+        """
+        Adds a single value.
+        """
+        position = bisect.bisect_right(self.edges, value)
+        if position == 0:
+            self.underflow += 1
+        elif position == len(self.edges):
+            self.overflow += 1
+        else:
+            self.counts[position - 1] += 1
+
+    def update(self, values):
+        """
+        Adds every value of an iterable.
+
+        Returns:
+            The histogram, for chaining.
+        """
+        add = self.add
+        for value in values:
+            add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Folds another Histogram with the same edges into this one.
+
+        Returns:
+            The histogram, for chaining.
+        """
+        if other.edges != self.edges:
+            raise ValueError("cannot merge histograms with different edges")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def buckets(self):
+        """
+        Returns:
+            A list of (low, high, count) tuples, one per bucket.
+        """
+        return [(low, high, count)
+                for low, high, count in zip(self.edges, self.edges[1:], self.counts)]
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog distinct-value counter. With the default precision of
+    12 it uses 4 KiB and has a standard error of about 1.6%.
+    """
+
+    def __init__(self, precision=12):
+        """
+        Args:
+            precision: log2 of the number of registers, 4 to 18.
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def _hash(value):
+        if isinstance(value, Decimal):
+            # Equal Decimals like 35 and 35.00 count as one value
+            value = value.normalize()
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, value):
+        """
+        Adds a single value.
+        """
+        hashed = self._hash(value)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        """
+        Adds every value of an iterable.
+
+        Returns:
+            The counter, for chaining.
+        """
+        add = self.add
+        for value in values:
+            add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Folds another HyperLogLog with the same precision into this one.
+
+        Returns:
+            The counter, for chaining.
+        """
+        if other.precision != self.precision:
+            raise ValueError("cannot merge HyperLogLogs with different precisions")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        Returns:
+            The estimated number of distinct values.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Test module for pool.ConnectionPool, with fake connections.
+"""
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """A connection that records being closed."""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+    """A connect function that numbers the connections it creates."""
+
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        connection = FakeConnection(len(self.created))
+        self.created.append(connection)
+        return connection
+
+
+def wait_until(condition, timeout=2.0):
+    """Polls condition until it is true or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestCheckout(unittest.TestCase):
+    """Tests acquire and release."""
+
+    def test_returned_connection_is_reused(self):
+        """Tests that close() returns the connection for the next checkout."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=2)
+        pool.acquire().close()
+        pool.acquire().close()
+        self.assertEqual(len(connect.created), 1)
+        self.assertFalse(connect.created[0].closed)
+        self.assertEqual(pool.stats()["checkouts"], 2)
+
+    def test_checkout_times_out(self):
+        """Tests that a full pool raises PoolTimeout after the timeout."""
+        pool = ConnectionPool(FakeConnector(), max_size=1)
+        held = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(timeout=0.05)
+        stats = pool.stats()
+        self.assertEqual((stats["waits"], stats["timeouts"]), (1, 1))
+        held.close()
+
+    def test_checkout_waits_for_a_return(self):
+        """Tests that a waiting checkout gets the connection returned."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=1, timeout=2.0)
+        held = pool.acquire()
+        timer = threading.Timer(0.05, held.close)
+        timer.start()
+        connection = pool.acquire()
+        timer.join()
+        self.assertIs(connection._connection, connect.created[0])
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_closed_pool_refuses_checkouts(self):
+        """Tests that acquire raises once the pool is closed."""
+        pool = ConnectionPool(FakeConnector())
+        pool.close()
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+
+
+class TestDiscard(unittest.TestCase):
+    """Tests that unusable connections are closed and replaced."""
+
+    def test_failed_health_check_is_replaced(self):
+        """Tests that an idle connection failing ping() is discarded."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=1,
+                              ping=lambda connection: connection.healthy)
+        pool.acquire().close()
+        connect.created[0].healthy = False
+        connection = pool.acquire()
+        self.assertIs(connection._connection, connect.created[1])
+        self.assertTrue(connect.created[0].closed)
+        stats = pool.stats()
+        self.assertEqual((stats["health_check_failures"], stats["size"]), (1, 1))
+
+    def test_failed_reset_is_discarded(self):
+        """Tests that a connection failing reset() is closed on return."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=1, reset=lambda connection: False)
+        pool.acquire().close()
+        self.assertTrue(connect.created[0].closed)
+        stats = pool.stats()
+        self.assertEqual((stats["discards"], stats["size"], stats["idle"]), (1, 0, 0))
+
+    def test_reset_error_is_discarded(self):
+        """Tests that a reset() raising counts as a failed reset."""
+        def reset(connection):
+            raise OSError("connection lost")
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=1, reset=reset)
+        pool.acquire().close()
+        self.assertTrue(connect.created[0].closed)
+        self.assertEqual(pool.stats()["size"], 0)
+
+
+class TestIdleEviction(unittest.TestCase):
+    """Tests that idle connections beyond min_size are closed."""
+
+    def test_reaper_evicts_down_to_min_size(self):
+        """Tests that idle connections close without another checkout."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, min_size=1, max_size=3, idle_timeout=0.05)
+        connections = [pool.acquire() for _ in range(3)]
+        for connection in connections:
+            connection.close()
+        self.assertTrue(wait_until(lambda: pool.stats()["size"] == 1))
+        self.assertEqual(pool.stats()["evictions"], 2)
+        self.assertEqual(sum(connection.closed for connection in connect.created), 2)
+        pool.close()
+        self.assertTrue(wait_until(lambda: not pool._reaper.is_alive()))
+
+    def test_evict_idle_keeps_recent_connections(self):
+        """Tests that connections idle for less than idle_timeout stay."""
+        pool = ConnectionPool(FakeConnector(), max_size=2, idle_timeout=60.0)
+        pool.acquire().close()
+        pool.evict_idle()
+        self.assertEqual(pool.stats()["idle"], 1)
+        pool.close()
+
+
+class TestFork(unittest.TestCase):
+    """Tests the pool's behaviour in a forked child."""
+
+    def test_child_starts_with_an_empty_pool(self):
+        """Tests that a child neither reuses nor closes the parent's connections."""
+        connect = FakeConnector()
+        pool = ConnectionPool(connect, max_size=1)
+        inherited = pool.acquire()
+        with patch("pool.os.getpid", return_value=os.getpid() + 1):
+            connection = pool.acquire(timeout=0.05)
+            self.assertIs(connection._connection, connect.created[1])
+            self.assertEqual(pool.stats()["checkouts"], 1)
+            inherited.close()
+            self.assertFalse(connect.created[0].closed)
+            self.assertEqual(pool.stats()["idle"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()